@@ -0,0 +1,55 @@
+# Compares two results files written by benchmarks/load_test.py, e.g. from
+# runs before and after a change:
+#
+#   python benchmarks/compare.py benchmarks/results/<before>.json benchmarks/results/<after>.json
+
+# import modules
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ["p50", "p95", "p99"]
+
+
+def change(before, after):
+    if not before:
+        return "     n/a"
+    return f"{(after - before) / before:>+8.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show how the latency and throughput of each endpoint changed between two load test runs.")
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+
+    before = json.loads(args.before.read_text())
+    after = json.loads(args.after.read_text())
+
+    print(f"{before['commit']} -> {after['commit']}")
+    print(f"picks/s: {before['picks_per_second']:.1f} -> {after['picks_per_second']:.1f} "
+          f"({change(before['picks_per_second'], after['picks_per_second']).strip()})")
+    print(f"{'endpoint':<36}{'rps':>8}" + "".join(f"{metric + ' ms':>24}" for metric in METRICS) + f"{'busy':>16}")
+
+    for endpoint in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        if endpoint not in before["endpoints"] or endpoint not in after["endpoints"]:
+            print(f"{endpoint:<36} only in {'after' if endpoint in after['endpoints'] else 'before'}")
+            continue
+        old = before["endpoints"][endpoint]
+        new = after["endpoints"][endpoint]
+        row = f"{endpoint:<36}{change(old['throughput_rps'], new['throughput_rps'])}"
+        for metric in METRICS:
+            old_latency = old["latency_ms"][metric]
+            new_latency = new["latency_ms"][metric]
+            row += f"{old_latency:>8.1f} ->{new_latency:>6.1f}{change(old_latency, new_latency)}"
+        row += f"{old['busy_rate']:>7.1%} ->{new['busy_rate']:>6.1%}"
+        print(row)
+
+    for name in sorted(set(before["transactions"]) | set(after["transactions"])):
+        old = before["transactions"].get(name, {}).get("abort_rate", 0)
+        new = after["transactions"].get(name, {}).get("abort_rate", 0)
+        print(f"transaction {name} abort rate: {old:.1%} -> {new:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# HTTP load test for a running MockMaster server. Simulates concurrent drafts
+# going through create -> join -> start -> pick until every roster is full,
+# alongside readers browsing the lobby, player search and player statistics,
+# and writes per-endpoint throughput, latency percentiles and busy (503) rates
+# to a JSON file that benchmarks/compare.py can diff against another run.
+#
+#   uvicorn src.api.server:app --port 8000 &
+#   python benchmarks/load_test.py --drafts 50 --concurrency 10 --readers 4
+#
+# Run against a database loaded with data/loader.py (and the fake data, for
+# realistic table sizes). The server's transaction counters (GET /transactions)
+# are read before and after the run to report serialization abort rates; they
+# are kept per server process, so start the server with a single worker for
+# complete abort counts. The client-side 503 counts are always complete.
+
+# import modules
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+import dotenv
+import httpx
+import numpy
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent))
+from src.position_requirements import POSITIONAL_REQUIREMENTS  # noqa: E402
+
+POSITIONS = ['QB', 'RB', 'WR', 'TE']
+SEARCH_YEARS = ["all", "2023", "2022", "2021", "2020", "2019"]
+SEARCH_SORTS = ["ppr_fantasy_points", "standard_fantasy_points", "player_name", "age"]
+
+# enough players of each position for the largest draft to fill every roster
+POOL_SIZE = 16 * 4
+# a polling client asks for new picks this often
+POLL_EVERY = 5
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Recorder:
+    """
+    Collects the latency and status code of every request, keyed by method and route template.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, endpoint, status_code, seconds):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status_code] += 1
+
+    def summary(self, duration):
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            latencies = numpy.array(self.latencies[endpoint]) * 1000
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "throughput_rps": len(latencies) / duration,
+                "statuses": {str(status): count for status, count in sorted(statuses.items())},
+                "busy_rate": statuses[503] / len(latencies),
+                "latency_ms": {
+                    "mean": float(latencies.mean()),
+                    "p50": float(numpy.percentile(latencies, 50)),
+                    "p95": float(numpy.percentile(latencies, 95)),
+                    "p99": float(numpy.percentile(latencies, 99)),
+                    "max": float(latencies.max())
+                }
+            }
+        return endpoints
+
+
+async def call(client, recorder, method, endpoint, url, **kwargs):
+    """
+    Sends a request and records it under endpoint. A 503 is retried after its Retry-After delay, as a client would,
+    and every attempt is recorded.
+    """
+
+    while True:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        recorder.record(f"{method} {endpoint}", response.status_code, time.perf_counter() - start)
+        if response.status_code != 503:
+            return response
+        await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+def expect(response, status_code=200):
+    if response.status_code != status_code:
+        raise BenchmarkError(f"{response.request.method} {response.request.url} returned {response.status_code}: {response.text}")
+    return response.json()
+
+
+async def player_pool(client, recorder):
+    """
+    Returns the best POOL_SIZE players of each position in the latest season, found through player search.
+    """
+
+    pool = {}
+    for position in POSITIONS:
+        players = []
+        page = ""
+        while len(players) < POOL_SIZE:
+            results = expect(await call(client, recorder, "GET", "/players/search/", "/players/search/",
+                                        params={"position": position, "year": "2023", "search_page": page}))
+            players.extend(row["player_id"] for row in results["results"])
+            page = results["next"]
+            if page == "":
+                break
+        if len(players) < POOL_SIZE:
+            raise BenchmarkError(f"Only {len(players)} {position}s found; is the player data loaded?")
+        pool[position] = players
+    return pool
+
+
+def choose_position(rng, requirements, counts, picks_left):
+    """
+    Returns a position the team can take without leaving a minimum unmet or passing a maximum.
+    """
+
+    short = [position for position in POSITIONS if counts[position] < requirements[position][0]]
+    needed = sum(requirements[position][0] - counts[position] for position in short)
+    if needed == picks_left:
+        return rng.choice(short)
+    return rng.choice([position for position in POSITIONS if counts[position] < requirements[position][1]])
+
+
+async def run_draft(client, recorder, pool, rng, draft_sizes, roster_sizes):
+    draft_size = rng.choice(draft_sizes)
+    roster_size = rng.choice(roster_sizes)
+    requirements = POSITIONAL_REQUIREMENTS[roster_size]
+
+    draft_id = expect(await call(client, recorder, "POST", "/drafts/", "/drafts/", json={
+        "draft_type": rng.choice(["PPR", "Standard"]),
+        "draft_name": "Benchmark Draft",
+        "draft_size": draft_size,
+        "roster_size": roster_size
+    }))["draft_id"]
+
+    # every seat is taken at once, as when a full lobby joins together
+    await asyncio.gather(*(
+        call(client, recorder, "POST", "/drafts/{draft_id}/join", f"/drafts/{draft_id}/join",
+             json={"team_name": f"Bench T{seat}", "user_name": f"Bench U{seat}"})
+        for seat in range(draft_size)
+    ))
+
+    expect(await call(client, recorder, "PUT", "/drafts/{draft_id}/start", f"/drafts/{draft_id}/start"))
+    order = expect(await call(client, recorder, "GET", "/drafts/{draft_id}/order", f"/drafts/{draft_id}/order"))
+    if len(order) != draft_size:
+        raise BenchmarkError(f"Draft {draft_id} started with {len(order)} of {draft_size} teams")
+
+    counts = {team["team_id"]: Counter() for team in order}
+    drafted = set()
+    total_picks = draft_size * roster_size
+    for pick_number in range(1, total_picks + 1):
+        team_id = expect(await call(client, recorder, "GET", "/drafts/{draft_id}/pick", f"/drafts/{draft_id}/pick"))["team_id"]
+        position = choose_position(rng, requirements, counts[team_id], roster_size - sum(counts[team_id].values()))
+        player_id = next(player_id for player_id in pool[position] if player_id not in drafted)
+
+        expect(await call(client, recorder, "POST", "/players/{player_id}/draft", f"/players/{player_id}/draft", json={"team_id": team_id}))
+        drafted.add(player_id)
+        counts[team_id][position] += 1
+
+        if pick_number % POLL_EVERY == 0:
+            await call(client, recorder, "GET", "/drafts/{draft_id}/picks", f"/drafts/{draft_id}/picks",
+                       params={"since": pick_number - POLL_EVERY})
+
+    await call(client, recorder, "GET", "/drafts/{draft_id}/picks", f"/drafts/{draft_id}/picks")
+    await call(client, recorder, "GET", "/teams/{team_id}", f"/teams/{order[0]['team_id']}")
+    expect(await call(client, recorder, "PUT", "/drafts/{draft_id}/end", f"/drafts/{draft_id}/end"))
+    return total_picks
+
+
+async def browse(client, recorder, pool, rng, done):
+    """
+    Reads the lobby, searches players and opens their statistics until the drafts are done.
+    """
+
+    player_ids = [player_id for players in pool.values() for player_id in players]
+    while not done.is_set():
+        results = (await call(client, recorder, "GET", "/players/search/", "/players/search/", params={
+            "position": rng.choice(["all"] + POSITIONS),
+            "year": rng.choice(SEARCH_YEARS),
+            "sort_col": rng.choice(SEARCH_SORTS)
+        })).json()
+        if results.get("next"):
+            await call(client, recorder, "GET", "/players/search/", "/players/search/", params={"search_page": results["next"]})
+        await call(client, recorder, "GET", "/players/{player_id}/", f"/players/{rng.choice(player_ids)}/")
+        await call(client, recorder, "GET", "/drafts/", "/drafts/")
+
+
+def transaction_deltas(before, after):
+    deltas = {}
+    for name, counters in after.items():
+        delta = {counter: value - before.get(name, {}).get(counter, 0) for counter, value in counters.items()}
+        if delta["attempts"]:
+            delta["abort_rate"] = delta["aborts"] / delta["attempts"]
+            deltas[name] = delta
+    return deltas
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=BENCHMARKS_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency * 16 + args.readers)
+    headers = {"access_token": args.api_key}
+
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        pool = await player_pool(client, Recorder())
+        transactions_before = (await client.get("/transactions")).json()
+
+        done = asyncio.Event()
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def limited_draft():
+            async with slots:
+                return await run_draft(client, recorder, pool, random.Random(rng.random()), args.draft_sizes, args.roster_sizes)
+
+        start = time.perf_counter()
+        readers = [asyncio.create_task(browse(client, recorder, pool, random.Random(rng.random()), done)) for _ in range(args.readers)]
+        try:
+            picks = await asyncio.gather(*(limited_draft() for _ in range(args.drafts)))
+        finally:
+            done.set()
+            await asyncio.gather(*readers)
+        duration = time.perf_counter() - start
+
+        transactions_after = (await client.get("/transactions")).json()
+
+    return {
+        "commit": current_commit(),
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "url": args.url,
+            "drafts": args.drafts,
+            "concurrency": args.concurrency,
+            "readers": args.readers,
+            "draft_sizes": args.draft_sizes,
+            "roster_sizes": args.roster_sizes,
+            "seed": args.seed
+        },
+        "duration_seconds": duration,
+        "picks": sum(picks),
+        "picks_per_second": sum(picks) / duration,
+        "endpoints": recorder.summary(duration),
+        "transactions": transaction_deltas(transactions_before, transactions_after)
+    }
+
+
+def print_summary(results):
+    print(f"{results['config']['drafts']} drafts, {results['picks']:,} picks in {results['duration_seconds']:.1f}s "
+          f"({results['picks_per_second']:.1f} picks/s)")
+    print(f"{'endpoint':<36}{'requests':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'busy':>8}")
+    for endpoint, metrics in results["endpoints"].items():
+        latency = metrics["latency_ms"]
+        print(f"{endpoint:<36}{metrics['requests']:>9}{metrics['throughput_rps']:>9.1f}{latency['p50']:>9.1f}"
+              f"{latency['p95']:>9.1f}{latency['p99']:>9.1f}{metrics['busy_rate']:>8.1%}")
+    for name, counters in results["transactions"].items():
+        print(f"transaction {name}: {counters['attempts']} attempts, {counters['abort_rate']:.1%} aborted, {counters['exhausted']} exhausted")
+
+
+def sizes(text):
+    return [int(size) for size in text.split(",")]
+
+
+def main():
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Load test a running MockMaster server and write the results as JSON.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the server")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY"), help="access token (default: API_KEY)")
+    parser.add_argument("--drafts", type=int, default=20, help="number of drafts to run to completion")
+    parser.add_argument("--concurrency", type=int, default=10, help="number of drafts running at once")
+    parser.add_argument("--readers", type=int, default=4, help="number of clients browsing search, statistics and the lobby")
+    parser.add_argument("--draft-sizes", type=sizes, default=[8, 10, 12], help="draft sizes to choose from, e.g. 8,10,12")
+    parser.add_argument("--roster-sizes", type=sizes, default=[8, 10, 12], help="roster sizes to choose from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout in seconds")
+    parser.add_argument("--out", type=Path, help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_summary(results)
+
+    out = args.out
+    if out is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = BENCHMARKS_DIR / "results" / f"{stamp}-{results['commit']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
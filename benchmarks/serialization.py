@@ -0,0 +1,185 @@
+# Per-request CPU spent turning query results into a response body, for the
+# list endpoints that return src/api/responses.JSONBytesResponse. Times the
+# previous path (a hand-built dict per row, then FastAPI's response_model
+# validation, jsonable_encoder and the json module) against the current one
+# (result tuples zipped into dicts and encoded with orjson), on real rows:
+#
+#   python -m benchmarks.serialization [--number 2000]
+#
+# Run it against the fake data so that the largest draft has a full board.
+
+# import modules
+import argparse
+import asyncio
+import json
+import time
+import sqlalchemy
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from src import database as db
+from src import player_index
+from src.api import responses
+from src.api.server import app
+
+
+def response_field(path):
+    # the response_model of the route, as FastAPI validates it
+    return next(route.response_field for route in app.routes if getattr(route, "path", None) == path)
+
+
+async def old_response(field, content):
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+def picks_by_hand(result):
+    return [{
+        "when_selected": row['when_selected'],
+        "player_id": row['player_id'],
+        "position": row['position'],
+        "team_name": row['team_name'],
+        "team_id": row['team_id']
+    } for row in result.mappings()]
+
+
+def order_by_hand(result):
+    return [{
+        "draft_position": row['draft_position'],
+        "team_id": row['team_id'],
+        "team_name": row['team_name']
+    } for row in result.mappings()]
+
+
+def seasons_by_hand(result):
+    return [{
+        'year': season.year,
+        'age': season.age,
+        'position': season.position,
+        'team': season.team,
+        'games_played': season.games_played,
+        'games_started': season.games_started,
+        'passing_yards': season.passing_yards,
+        'passing_tds': season.passing_tds,
+        'interceptions': season.interceptions,
+        'rushing_atts': season.rushing_atts,
+        'rushing_yards': season.rushing_yards,
+        'rushing_tds': season.rushing_tds,
+        'targets': season.targets,
+        'receptions': season.receptions,
+        'receiving_yards': season.receiving_yards,
+        'receiving_tds': season.receiving_tds,
+        'fumbles': season.fumbles,
+        'fumbles_lost': season.fumbles_lost,
+        'two_point_conversions_passing': season.two_point_conversions_passing,
+        'two_point_conversions': season.two_point_conversions,
+        'fantasy_points_standard_10': season.fantasy_points_standard_10 / 10,
+        'fantasy_points_ppr_10': season.fantasy_points_ppr_10 / 10
+    } for season in result.mappings()]
+
+
+def search_by_hand(index, matches):
+    return [{
+        "player_id": row["player_id"],
+        "player_name": row["player_name"],
+        "year": row["year"],
+        "age": row["age"],
+        "position": row["position"],
+        "team": row["team"],
+        "standard_fantasy_points": row["fantasy_points_standard_10"] / 10,
+        "ppr_fantasy_points": row["fantasy_points_ppr_10"] / 10
+    } for row in (index.row(i) for i in matches)]
+
+
+async def cpu_time(function, number):
+    start = time.process_time()
+    for _ in range(number):
+        body = function()
+        if asyncio.iscoroutine(body):
+            await body
+    return (time.process_time() - start) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization", description="Compare the CPU cost of building list responses.")
+    parser.add_argument("--number", type=int, default=2000, help="responses to build per endpoint and path")
+    args = parser.parse_args()
+
+    with db.engine.connect() as connection:
+        draft_id = connection.execute(sqlalchemy.text("""
+            SELECT draft_id FROM drafts
+            WHERE draft_status = 'ended'
+            ORDER BY pick_count DESC, draft_id
+            LIMIT 1
+        """)).scalar_one()
+        player_id = connection.execute(sqlalchemy.text("""
+            SELECT player_id FROM stats
+            GROUP BY player_id
+            ORDER BY count(*) DESC, player_id
+            LIMIT 1
+        """)).scalar_one()
+
+        # frozen results can be replayed as a fresh Result for every response
+        picks = connection.execute(sqlalchemy.text("""
+            SELECT selections.when_selected, selections.player_id, player_positions.position, teams.team_name, teams.team_id
+            FROM selections
+            JOIN teams ON selections.team_id = teams.team_id
+            JOIN player_positions ON selections.player_id = player_positions.player_id
+            WHERE selections.draft_id = :draft_id
+            ORDER BY selections.when_selected ASC
+        """), {"draft_id": draft_id}).freeze()
+        order = connection.execute(sqlalchemy.text("""
+            SELECT draft_position, team_id, team_name FROM teams
+            WHERE draft_id = :draft_id
+            ORDER BY draft_position ASC
+        """), {"draft_id": draft_id}).freeze()
+        # before and after the fantasy points were divided in the query
+        old_seasons = connection.execute(sqlalchemy.text("""
+            SELECT * FROM stats
+            WHERE player_id = :player_id
+            ORDER BY year ASC
+        """), {"player_id": player_id}).freeze()
+        seasons = connection.execute(sqlalchemy.text("""
+            SELECT year, age, position, team, games_played, games_started,
+                passing_yards, passing_tds, interceptions, rushing_atts, rushing_yards, rushing_tds,
+                targets, receptions, receiving_yards, receiving_tds, fumbles, fumbles_lost,
+                two_point_conversions_passing, two_point_conversions,
+                fantasy_points_standard_10 / 10::float8 AS fantasy_points_standard_10,
+                fantasy_points_ppr_10 / 10::float8 AS fantasy_points_ppr_10
+            FROM stats
+            WHERE player_id = :player_id
+            ORDER BY year ASC
+        """), {"player_id": player_id}).freeze()
+        index = player_index.PlayerIndex(connection.execute(sqlalchemy.select(db.player_points)).fetchall())
+
+    matches, _ = index.search()
+    search_field = response_field("/players/search/")
+
+    endpoints = [
+        (f"GET /drafts/{draft_id}/picks", len(picks().fetchall()),
+         lambda: old_response(None, picks_by_hand(picks())),
+         lambda: responses.JSONBytesResponse(responses.records(picks())).body),
+        (f"GET /drafts/{draft_id}/order", len(order().fetchall()),
+         lambda: old_response(None, order_by_hand(order())),
+         lambda: responses.JSONBytesResponse(responses.records(order())).body),
+        # statistics bodies are cached, so this is the cost of a cache miss; they were already encoded without FastAPI
+        (f"GET /players/{player_id}/", len(seasons().fetchall()),
+         lambda: json.dumps({"player_id": player_id, "seasons": seasons_by_hand(old_seasons())}, ensure_ascii=False, separators=(",", ":")).encode(),
+         lambda: responses.dumps({"player_id": player_id, "seasons": responses.records(seasons())})),
+        ("GET /players/search/", len(matches),
+         lambda: old_response(search_field, {"previous": "", "next": "", "results": search_by_hand(index, matches)}),
+         lambda: responses.JSONBytesResponse({"previous": "", "next": "", "results": index.records(matches)}).body)
+    ]
+
+    asyncio.run(compare(endpoints, args.number))
+
+
+async def compare(endpoints, number):
+    print(f"{'endpoint':<36}{'rows':>6}{'before us':>12}{'after us':>12}{'saved us':>12}{'speedup':>10}")
+    for name, rows, before, after in endpoints:
+        before_time = await cpu_time(before, number)
+        after_time = await cpu_time(after, number)
+        print(f"{name:<36}{rows:>6}{before_time * 1e6:>12.1f}{after_time * 1e6:>12.1f}{(before_time - after_time) * 1e6:>12.1f}"
+              f"{before_time / after_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# Query plan regression tests. Finds every SQL statement the API runs (the
+# sqlalchemy.text() literals in SOURCES, and the statements inside the database
+# functions of schema.sql), EXPLAINs each one with sample parameters, and fails
+# if a plan sequentially scans a large table or is estimated to cost more than
+# the budget.
+#
+#   python -m pytest benchmarks/test_query_plans.py
+#
+# The plans are only meaningful at realistic table sizes; on a nearly empty
+# database every table is small and nothing can fail. So the fake_database
+# fixture generates the fake data and loads it into a scratch database next to
+# the one POSTGRES_URI names, which is dropped again afterwards. The tests are
+# skipped when POSTGRES_URI is not set.
+
+# import modules
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+import dotenv
+import psycopg2
+import pytest
+import sqlalchemy
+from data import loader
+
+ROOT = Path(__file__).resolve().parent.parent
+SOURCES = sorted((ROOT / "src" / "api").glob("*.py")) + [ROOT / "src" / "draft_state.py", ROOT / "src" / "player_index.py"]
+SCHEMA_PATH = ROOT / "schema.sql"
+
+# drafts the fixture generates; enough for selections, teams and pick_schedule to be well past LARGE_TABLE_ROWS
+FAKE_DRAFTS = 10000
+
+# tables with more rows than this must not be read with a sequential scan
+LARGE_TABLE_ROWS = 10000
+# the planner's estimated total cost a statement may reach; reading every pick of the largest draft
+# (16 teams x 12 rounds) through indexes costs about 1,100
+COST_BUDGET = 2000
+
+# (function, table) pairs allowed to scan a large table, with the reason
+ALLOWED_SEQ_SCANS = {}
+
+BIND_PARAMETER = re.compile(r"(?<!:):(\w+)")
+
+FUNCTION = re.compile(r"create\s+or\s+replace\s+function\s+public\.(\w+)\((.*?)\)\s*returns\s+(\w+).*?as\s+\$\$(.*?)\$\$",
+                      re.IGNORECASE | re.DOTALL)
+# statements in a plpgsql body end at a semicolon, and the ones inside an if or a loop start after its then or loop;
+# the lookahead skips anything inside a string literal
+PLPGSQL_BOUNDARY = re.compile(r"(?:;|\bthen[ \t]*\n|\bloop[ \t]*\n)(?=(?:[^']*'[^']*')*[^']*$)", re.IGNORECASE)
+PLPGSQL_STATEMENT = re.compile(r"^(?:(?:begin|else)\s+)*(?:return\s+query\s+|for\s+\w+\s+in\s+|perform\s+)?(?=(?:select|with|insert|update|delete)\b)",
+                               re.IGNORECASE)
+PLPGSQL_PERFORM = re.compile(r"^(?:(?:begin|else)\s+)*perform\s+", re.IGNORECASE)
+SELECT_INTO = re.compile(r"\binto\s+\w+(?:\s*,\s*\w+)*\s+(?=from\b)", re.IGNORECASE)
+READS_OR_WRITES = re.compile(r"\b(?:from|insert|update|delete)\b", re.IGNORECASE)
+
+
+class Statement:
+    def __init__(self, path, function, line, sql):
+        self.path = path
+        self.function = function
+        self.line = line
+        self.sql = sql
+
+    @property
+    def location(self):
+        return f"{self.path.relative_to(ROOT)}:{self.line} ({self.function})"
+
+
+def find_statements(path):
+    """
+    Returns every sqlalchemy.text() literal in the file, labelled with the top-level function (the endpoint) it is in.
+    """
+
+    statements = []
+    for function in ast.parse(path.read_text()).body:
+        if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for node in ast.walk(function):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "text"
+                    and node.args and isinstance(node.args[0], ast.Constant)):
+                statements.append(Statement(path, function.name, node.lineno, node.args[0].value))
+    return sorted(statements, key=lambda statement: statement.line)
+
+
+def function_variables(arguments, body, returns):
+    """
+    Returns the scalar variables (arguments and declared variables) and the record variables of a database function.
+    The columns of a returns table are left out: with #variable_conflict use_column the statements read them as columns.
+    """
+
+    scalars = [argument.split()[0] for argument in arguments.split(",") if argument.strip()]
+    records = ["new", "old"] if returns.lower() == "trigger" else []
+    declared = re.search(r"\bdeclare\b(.*?)\bbegin\b", body, re.IGNORECASE | re.DOTALL)
+    for declaration in (declared.group(1).split(";") if declared else []):
+        if declaration.strip():
+            name, kind = declaration.split()[:2]
+            (records if kind.lower() == "record" else scalars).append(name)
+    return scalars, records
+
+
+def as_parameters(sql, scalars, records):
+    """
+    Replaces the variables in a statement with bind parameters; record fields become <record>_<field>.
+    """
+
+    for record in records:
+        sql = re.sub(rf"(?<![.\w]){record}\.(\w+)", rf"(:{record}_\1)", sql)
+    for scalar in scalars:
+        sql = re.sub(rf"(?<![.\w:]){scalar}\b", f"(:{scalar})", sql)
+    return sql
+
+
+def find_function_statements(path):
+    """
+    Returns the statements inside the bodies of the database functions that read or write a table, labelled with
+    the function they are in. Statements that only compute a result row (return query select 409, ...) are skipped.
+    """
+
+    schema = path.read_text()
+    statements = []
+    for function in FUNCTION.finditer(schema):
+        name, arguments, returns, body = function.groups()
+        body_start = function.start(4)
+        body = re.sub(r"--[^\n]*|^\s*#[^\n]*", lambda comment: " " * len(comment.group()), body, flags=re.MULTILINE)
+        scalars, records = function_variables(arguments, body, returns)
+
+        start = 0
+        for boundary in [*PLPGSQL_BOUNDARY.finditer(body), None]:
+            end = boundary.start() if boundary else len(body)
+            piece = body[start:end]
+            offset = start + len(piece) - len(piece.lstrip())
+            start = boundary.end() if boundary else end
+            piece = piece.strip()
+
+            prefix = PLPGSQL_STATEMENT.match(piece) or PLPGSQL_PERFORM.match(piece)
+            if prefix is None:
+                continue
+            sql = piece[prefix.end():]
+            if prefix.re is PLPGSQL_PERFORM:
+                sql = "select " + sql
+            if not READS_OR_WRITES.search(sql):
+                continue
+            if re.match(r"(?:select|with)\b", sql, re.IGNORECASE):
+                sql = SELECT_INTO.sub("", sql)
+            line = schema.count("\n", 0, body_start + offset + prefix.end()) + 1
+            statements.append(Statement(path, name, line, as_parameters(sql, scalars, records)))
+    return statements
+
+
+def sample_parameters(connection):
+    """
+    Returns a value for every bind parameter name the statements use, taken from the largest ended draft.
+    """
+
+    draft = connection.execute(sqlalchemy.text("""
+        SELECT draft_id, draft_size, roster_size FROM drafts
+        WHERE draft_status = 'ended'
+        ORDER BY pick_count DESC, draft_id
+        LIMIT 1
+    """)).one()
+
+    team = connection.execute(sqlalchemy.text("""
+        SELECT team_id, team_name, user_name FROM teams
+        WHERE draft_id = :draft_id
+        ORDER BY draft_position
+        LIMIT 1
+    """), {"draft_id": draft.draft_id}).one()
+    player_id = connection.execute(sqlalchemy.text("""
+        SELECT player_id FROM selections
+        WHERE draft_id = :draft_id AND when_selected = 1
+    """), {"draft_id": draft.draft_id}).scalar_one()
+
+    return {
+        "draft_id": draft.draft_id,
+        "id": draft.draft_id,
+        "team_id": team.team_id,
+        "team": team.team_name,
+        "team_name": team.team_name,
+        "user": team.user_name,
+        "player_id": player_id,
+        "player_ids": [player_id],
+        "name": "Sample Draft",
+        "type": "PPR",
+        "dsize": draft.draft_size,
+        "rsize": draft.roster_size,
+        "position": "QB",
+        "min": 1,
+        "max": 3,
+        "rank": 1,
+        "since": 0,
+        "cursor": None,
+        "draft_type": None,
+        "draft_size": None,
+        "roster_size": None,
+        "min_open_seats": 1,
+        "limit": 20,
+        "positions": list(range(1, draft.draft_size + 1)) * draft.roster_size,
+        # variables of the database functions
+        "clock_draft_id": draft.draft_id,
+        "pick_draft_id": draft.draft_id,
+        "queue_draft_id": draft.draft_id,
+        "new_draft_id": draft.draft_id,
+        "new_draft_status": "active",
+        "pick_team_id": team.team_id,
+        "current_team_id": team.team_id,
+        "pick_player_id": player_id,
+        "queued_player_id": player_id,
+        "pick_position": "QB",
+        "pick_roster_size": draft.roster_size,
+        "current_pick": 1
+    }
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check_statement(connection, statement, parameters, table_rows, cost_budget):
+    """
+    EXPLAINs the statement and returns (total cost, list of problems).
+    """
+
+    names = set(BIND_PARAMETER.findall(statement.sql))
+    missing = names - parameters.keys()
+    if missing:
+        return None, [f"no sample value for {', '.join(sorted(missing))}; add one to sample_parameters"]
+
+    explained = connection.execute(sqlalchemy.text("EXPLAIN (FORMAT JSON) " + statement.sql.strip().rstrip(";")),
+                                   {name: parameters[name] for name in names}).scalar_one()
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    plan = explained[0]["Plan"]
+
+    problems = []
+    for node in plan_nodes(plan):
+        table = node.get("Relation Name")
+        if node["Node Type"] == "Seq Scan" and table_rows.get(table, 0) > LARGE_TABLE_ROWS \
+                and (statement.function, table) not in ALLOWED_SEQ_SCANS:
+            problems.append(f"sequential scan on {table} ({table_rows[table]:,} rows)")
+    if plan["Total Cost"] > cost_budget:
+        problems.append(f"estimated cost {plan['Total Cost']:,.0f} is over the budget of {cost_budget:,}")
+    return plan["Total Cost"], problems
+
+
+STATEMENTS = [statement for path in SOURCES for statement in find_statements(path)] + find_function_statements(SCHEMA_PATH)
+
+
+@pytest.fixture(scope="session")
+def fake_database(tmp_path_factory):
+    """
+    Generates the fake data, loads it into a scratch database and yields an engine for it.
+    """
+
+    dotenv.load_dotenv()
+    if not os.environ.get("POSTGRES_URI"):
+        pytest.skip("POSTGRES_URI is not set")
+    url = sqlalchemy.engine.make_url(os.environ["POSTGRES_URI"]).set(drivername="postgresql")
+    scratch_url = url.set(database=f"{url.database}_query_plans")
+
+    def run(statement):
+        # CREATE and DROP DATABASE cannot run in a transaction
+        connection = psycopg2.connect(url.render_as_string(hide_password=False))
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(statement)
+        finally:
+            connection.close()
+
+    run(f'DROP DATABASE IF EXISTS "{scratch_url.database}"')
+    run(f'CREATE DATABASE "{scratch_url.database}"')
+    try:
+        fake_dir = tmp_path_factory.mktemp("fake")
+        subprocess.run([sys.executable, str(ROOT / "data" / "generator.py"), "--drafts", str(FAKE_DRAFTS), "--out-dir", str(fake_dir)],
+                       check=True)
+        loader.load(fake=True, fake_dir=fake_dir, url=scratch_url.render_as_string(hide_password=False))
+
+        engine = sqlalchemy.create_engine(scratch_url)
+        yield engine
+        engine.dispose()
+    finally:
+        run(f'DROP DATABASE IF EXISTS "{scratch_url.database}"')
+
+
+@pytest.fixture(scope="session")
+def table_rows(fake_database):
+    with fake_database.connect() as connection:
+        return dict(connection.execute(sqlalchemy.text("""
+            SELECT relname, reltuples::bigint FROM pg_class
+            WHERE relkind IN ('r', 'm') AND relnamespace = 'public'::regnamespace
+        """)).fetchall())
+
+
+@pytest.fixture(scope="session")
+def parameters(fake_database):
+    with fake_database.connect() as connection:
+        return sample_parameters(connection)
+
+
+@pytest.fixture
+def connection(fake_database):
+    # EXPLAIN does not run the inserts and updates, but nothing is committed either way
+    with fake_database.connect() as connection:
+        yield connection
+        connection.rollback()
+
+
+@pytest.mark.parametrize("statement", STATEMENTS, ids=lambda statement: statement.location)
+def test_query_plan(connection, statement, parameters, table_rows):
+    cost, problems = check_statement(connection, statement, parameters, table_rows, COST_BUDGET)
+    assert not problems, f"{statement.location}: {'; '.join(problems)}"
@@ -1,105 +1,225 @@
-# create 8,696 draft instances
-# drafts = 8,696 rows
-# position requirements = 34,784 rows
-# teams = 86,960 rows
-# selections = 869,600
-# across all tables = 1,000,040 rows
+# Generates fake drafts for load testing, written as CSV shards in parallel:
+#   fake_drafts_<shard>.csv, fake_position_requirements_<shard>.csv, fake_teams_<shard>.csv,
+#   fake_pick_schedule_<shard>.csv and fake_selections_<shard>.csv
+# which data/loader.py --fake loads. Rows carry explicit ids, the draft counters and the
+# pick schedule, so shards are independent of each other and the loader needs no fix-ups.
+#
+#   python data/generator.py                                   # 10,000 drafts, ~1M selections
+#   python data/generator.py --drafts 120000 --workers 8       # ~10M selections
+#   python data/generator.py --draft-sizes 2-16 --roster-sizes 12 --statuses active:1,pending:1
+#
+# Distributions are comma-separated value:weight pairs (a value alone has weight 1, a-b
+# expands to every integer in the range). Every team's roster respects the position
+# minimums and maximums of its draft, and no player is drafted twice in one draft.
 
 # import modules
-import csv
-
-# generate fake draft data
-with open("fake/fake_drafts.csv", mode="w", newline="") as file:
-    writer = csv.writer(file)
-
-    writer.writerow(["draft_name","draft_type","roster_size","draft_size","draft_status"])
-
-    i = 1
-    while i <= 8696:
-        draft_name = f"Fake Draft {i}"
-        if i%2 == 0:
-            draft_type = "PPR"
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy
+import pandas
+
+DATA_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(DATA_DIR.parent))
+from src import pick_schedule  # noqa: E402
+from src.position_requirements import POSITIONAL_REQUIREMENTS  # noqa: E402
+
+POSITIONS = ['QB', 'RB', 'WR', 'TE']
+DRAFT_TYPES = ['PPR', 'Standard']
+STATUSES = ['pending', 'active', 'paused', 'ended']
+
+# team_ids are allocated in blocks of the largest draft size, so each shard can number its teams on its own
+TEAM_ID_BLOCK = 16
+
+
+def parse_distribution(text, cast=int):
+    """
+    Parses "10:4,12:3,8" or "2-16" into (values, probabilities).
+    """
+
+    values = []
+    weights = []
+    for item in text.split(","):
+        value, _, weight = item.partition(":")
+        weight = float(weight) if weight else 1.0
+        if cast is int and "-" in value:
+            low, high = (int(bound) for bound in value.split("-"))
+            expanded = list(range(low, high + 1))
         else:
-            draft_type = "Standard"
-        roster_size = 10
-        draft_size = 10
-        draft_status = "completed"
-        
-        writer.writerow([draft_name, draft_type, roster_size, draft_size, draft_status])
-
-        i = i + 1
-
-# generate fake position requirements data
-with open("fake/fake_position_requirements.csv", mode="w", newline="") as file:
-    writer = csv.writer(file)
-
-    writer.writerow(["draft_id","position","min","max"])
-
-    i = 1
-    while i <= 8696:
-        for pos in ["QB", "RB", "WR", "TE"]:
-            draft_id = i
-            position = pos
-            min = 1
-            max = 4
-            
-            writer.writerow([draft_id, position, min, max])
-
-        i = i + 1
-
-# generate fake team data
-with open("fake/fake_teams.csv", mode="w", newline="") as file:
-    writer = csv.writer(file)
-
-    writer.writerow(["team_name","user_name","draft_position","draft_id"])
-
-    i = 1
-    while i <= 8696:
-        j = 1
-        while j <= 10:
-            team_id = (i-1)*10 + j
-            team_name = f"Fake Team {(i-1)*10 + j}"
-            user_name = f"Fake User {(i-1)*10 + j}"
-            draft_position = j
-            draft_id = i
-        
-            writer.writerow([team_name, user_name, draft_position, draft_id])
-
-            j = j + 1
-        i = i + 1
-
-# ids of players to be drafted (20 QB, 30 RB, 30WR, 20TE)
-player_ids = [
-    "JackLa00", "PresDa01", "WilsRu00", "WatsDe00", "MahoPa00", "MurrKy00", "RodgAa00", "RyanMa00", "BreeDr00", "TannRy00",
-    "WentCa00", "DarnSa00", "CarrDe02", "CousKi00", "AlleJo02", "MayfBa00", "KeenCa00", "RiddDe00", "WalkPh00", "BridTe00",
-    "McCaCh01", "HenrDe00", "JoneAa00", "ElliEz00", "CookDa01", "ChubNi00", "IngrMa01", "EkelAu00", "CarsCh00", "BarkSa00",
-    "MixoJo00", "GurlTo01", "DrakKe00", "MontDa01", "MichSo00", "FreeDe00", "HydeCa00", "JohnDu00", "MostRa00", "SandEm00",
-    "ConnJa00", "ColeTe01", "PerrBr02", "BarbPe01", "HowaJo00", "PennRa00", "KnigZo00", "HuntCa02", "BreiMa00", "JuszKy00",
-    "LindPh00", "WallDa01", "KelcTr00", "AndrMa00", "KittGe00", "CookJa02", "HoopAu00", "PruiMy00", "ThomLo00", "GoedDa00",
-    "HillTa00", "HigbTy00", "McLaTe00", "EvanMi00", "GesiMi00", "HenrHu00", "TonyRo00", "LikeIs00", "DissWi00", "OttoCa00",
-    "CookDa01", "ThomMi05", "GodwCh00", "GollKe00", "KuppCo00", "JoneJu02", "LandJa00", "MoorD.00", "WoodRo02", "BrowAJ00",
-    "HopkDe00", "RobiAl02", "CharDJ00", "LockTy00", "BoydTy00", "RidlCa00", "SuttCo00", "DiggSt00", "BeckOd00", "AlleKe00",
-    "WillMi07", "SlayDa01", "SamuDe00", "KirkCh01", "HardMe00", "PascZa00", "JameRi00", "ShahRa00", "ZaccOl01", "ReynJo00"
-]
-
-# generate fake selection data
-with open("fake/fake_selections.csv", mode="w", newline="") as file:
-    writer = csv.writer(file)
-
-    writer.writerow(["team_id","player_id","when_selected"])
-
-    i = 1
-    while i <= 8696:
-        k = 1
-        while k <= 10:
-            j = 1
-            while j <= 10:
-                team_id = (i-1)*10 + j
-                when_selected = (k-1)*10 + j
-                player_id = player_ids[when_selected-1]
-            
-                writer.writerow([team_id, player_id, when_selected])
-
-                j = j + 1
-            k = k + 1
-        i = i + 1
+            expanded = [cast(value)]
+        values.extend(expanded)
+        weights.extend([weight] * len(expanded))
+
+    weights = numpy.array(weights)
+    return numpy.array(values), weights / weights.sum()
+
+
+def player_pool(popularity):
+    """
+    Returns, for each position, the player_ids of that position and the chance of each being picked. Players are ranked
+    by the PPR points of their most recent season, and the chance of the player ranked r is proportional to 1 / r^popularity.
+    """
+
+    stats = pandas.read_csv(DATA_DIR / "stats.csv")
+    recent = stats.sort_values("year").groupby("player_id").tail(1)
+
+    pool = {}
+    for position in POSITIONS:
+        players = recent[recent["position"] == position].sort_values("fantasy_points_ppr_10", ascending=False)
+        weights = 1 / numpy.arange(1, len(players) + 1) ** popularity
+        pool[position] = (players["player_id"].to_numpy(dtype=object), weights / weights.sum())
+    return pool
+
+
+def team_rosters(rng, number_of_teams, roster_size):
+    """
+    Returns a (teams x roster_size) array of position indexes: the position each team drafts with each of its picks.
+    Every roster meets the position minimums, fills its remaining slots at random without passing any maximum, and is
+    drafted in random order, which the minimums check of draft_pick always accepts for a roster that meets them.
+    """
+
+    requirements = POSITIONAL_REQUIREMENTS[roster_size]
+    minimums = numpy.array([requirements[position][0] for position in POSITIONS])
+    # one token per slot a position can take above its minimum
+    spare_slots = numpy.repeat(numpy.arange(len(POSITIONS)), [requirements[position][1] - requirements[position][0] for position in POSITIONS])
+    extra = roster_size - minimums.sum()
+
+    chosen = numpy.argsort(rng.random((number_of_teams, len(spare_slots))), axis=1)[:, :extra]
+    counts = minimums + numpy.stack([numpy.bincount(row, minlength=len(POSITIONS)) for row in spare_slots[chosen]])
+
+    rosters = numpy.repeat(numpy.tile(numpy.arange(len(POSITIONS)), number_of_teams), counts.ravel()).reshape(number_of_teams, roster_size)
+    return rng.permuted(rosters, axis=1)
+
+
+def generate_shard(shard, first_draft_id, number_of_drafts, options, pool, out_dir):
+    rng = numpy.random.default_rng([options["seed"], shard])
+    draft_sizes = rng.choice(options["draft_sizes"][0], size=number_of_drafts, p=options["draft_sizes"][1])
+    roster_sizes = rng.choice(options["roster_sizes"][0], size=number_of_drafts, p=options["roster_sizes"][1])
+    statuses = rng.choice(options["statuses"][0], size=number_of_drafts, p=options["statuses"][1])
+    draft_types = rng.choice(DRAFT_TYPES, size=number_of_drafts)
+
+    drafts = []
+    requirements = []
+    teams = []
+    schedules = []
+    # ids and player_ids of the selections, kept apart so the ids stay integer arrays
+    selection_ids = []
+    selection_players = []
+
+    for i in range(number_of_drafts):
+        draft_id = first_draft_id + i
+        draft_size = int(draft_sizes[i])
+        roster_size = int(roster_sizes[i])
+        status = statuses[i]
+        team_ids = (draft_id - 1) * TEAM_ID_BLOCK + numpy.arange(1, draft_size + 1)
+
+        for position in POSITIONS:
+            requirements.append((draft_id, position, *POSITIONAL_REQUIREMENTS[roster_size][position]))
+
+        if status == 'pending':
+            # still filling up: no draft order, schedule or picks yet
+            team_count = int(rng.integers(0, draft_size + 1))
+            for team_id in team_ids[:team_count]:
+                teams.append((team_id, draft_id, f"Fake Team {team_id}", f"Fake User {team_id}", None))
+            drafts.append((draft_id, f"Fake Draft {draft_id}", draft_types[i], roster_size, draft_size, status, team_count, 0))
+            continue
+
+        # drafts start once every seat is taken
+        total_picks = draft_size * roster_size
+        pick_count = total_picks if status == 'ended' else int(rng.integers(0, total_picks))
+        drafts.append((draft_id, f"Fake Draft {draft_id}", draft_types[i], roster_size, draft_size, status, draft_size, pick_count))
+
+        # team_ids[order[k]] has draft position k + 1
+        order = rng.permutation(draft_size)
+        for position_number, team in enumerate(order, start=1):
+            team_id = team_ids[team]
+            teams.append((team_id, draft_id, f"Fake Team {team_id}", f"Fake User {team_id}", position_number))
+
+        pick_teams = order[numpy.array(pick_schedule.draft_positions(draft_size, roster_size)) - 1]
+        pick_numbers = numpy.arange(1, total_picks + 1)
+        schedules.append(numpy.column_stack([numpy.full(total_picks, draft_id), pick_numbers, team_ids[pick_teams]]))
+
+        if pick_count == 0:
+            continue
+
+        # every team makes one pick per round, so a team's n-th pick is in round n
+        rosters = team_rosters(rng, draft_size, roster_size)
+        pick_positions = rosters[pick_teams, (pick_numbers - 1) // draft_size][:pick_count]
+        player_ids = numpy.empty(pick_count, dtype=object)
+        for position_index, position in enumerate(POSITIONS):
+            picks = numpy.flatnonzero(pick_positions == position_index)
+            if len(picks):
+                candidates, chances = pool[position]
+                player_ids[picks] = rng.choice(candidates, size=len(picks), replace=False, p=chances)
+
+        selection_ids.append(numpy.column_stack([numpy.full(pick_count, draft_id), team_ids[pick_teams[:pick_count]], pick_numbers[:pick_count]]))
+        selection_players.append(player_ids)
+
+    name = f"{shard:03d}"
+    pandas.DataFrame(drafts, columns=["draft_id", "draft_name", "draft_type", "roster_size", "draft_size", "draft_status", "team_count", "pick_count"]) \
+        .to_csv(out_dir / f"fake_drafts_{name}.csv", index=False)
+    pandas.DataFrame(requirements, columns=["draft_id", "position", "min", "max"]) \
+        .to_csv(out_dir / f"fake_position_requirements_{name}.csv", index=False)
+    pandas.DataFrame(teams, columns=["team_id", "draft_id", "team_name", "user_name", "draft_position"]).astype({"draft_position": "Int64"}) \
+        .to_csv(out_dir / f"fake_teams_{name}.csv", index=False)
+    pandas.DataFrame(numpy.concatenate(schedules or [numpy.empty((0, 3), dtype=int)]), columns=["draft_id", "pick_number", "team_id"]) \
+        .to_csv(out_dir / f"fake_pick_schedule_{name}.csv", index=False)
+    ids = numpy.concatenate(selection_ids or [numpy.empty((0, 3), dtype=int)])
+    pandas.DataFrame({
+        "draft_id": ids[:, 0],
+        "team_id": ids[:, 1],
+        "player_id": numpy.concatenate(selection_players or [numpy.empty(0, dtype=object)]),
+        "when_selected": ids[:, 2]
+    }).to_csv(out_dir / f"fake_selections_{name}.csv", index=False)
+
+    return len(drafts), len(teams), len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate fake drafts, teams and selections as CSV shards for data/loader.py --fake.")
+    parser.add_argument("--drafts", type=int, default=10000, help="number of drafts to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed; the same seed and options give the same data")
+    parser.add_argument("--draft-sizes", default="8:2,10:4,12:3,14:1,16:1", help="distribution of teams per draft (2-16)")
+    parser.add_argument("--roster-sizes", default="8:1,10:2,12:1", help="distribution of roster sizes (8, 10 or 12)")
+    parser.add_argument("--statuses", default="ended:90,active:4,paused:1,pending:5", help="distribution of draft statuses")
+    parser.add_argument("--popularity", type=float, default=1.0, help="how strongly picks favour highly ranked players (0 is uniform)")
+    parser.add_argument("--shards", type=int, default=8, help="number of shards (files per table)")
+    parser.add_argument("--workers", type=int, help="number of processes (default: one per CPU)")
+    parser.add_argument("--out-dir", type=Path, default=DATA_DIR / "fake", help="where the shards are written")
+    args = parser.parse_args()
+
+    options = {
+        "seed": args.seed,
+        "draft_sizes": parse_distribution(args.draft_sizes),
+        "roster_sizes": parse_distribution(args.roster_sizes),
+        "statuses": parse_distribution(args.statuses, cast=str)
+    }
+    if not set(options["draft_sizes"][0]) <= set(range(2, TEAM_ID_BLOCK + 1)):
+        parser.error("draft sizes must be between 2 and 16")
+    if not set(options["roster_sizes"][0]) <= set(POSITIONAL_REQUIREMENTS):
+        parser.error("roster sizes must be 8, 10 or 12")
+    if not set(options["statuses"][0]) <= set(STATUSES):
+        parser.error(f"statuses must be among {', '.join(STATUSES)}")
+
+    pool = player_pool(args.popularity)
+
+    # shards from an earlier run would otherwise be loaded alongside these
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    for old_shard in args.out_dir.glob("fake_*.csv"):
+        old_shard.unlink()
+
+    shards = min(args.shards, args.drafts)
+    sizes = [args.drafts // shards + (1 if shard < args.drafts % shards else 0) for shard in range(shards)]
+    first_draft_ids = numpy.cumsum([1] + sizes[:-1])
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(generate_shard, shard, int(first_draft_ids[shard]), sizes[shard], options, pool, args.out_dir)
+                   for shard in range(shards)]
+        totals = numpy.sum([future.result() for future in futures], axis=0)
+
+    print(f"Generated {totals[0]:,} drafts, {totals[1]:,} teams and {totals[2]:,} selections in {shards} shards in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
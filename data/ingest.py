@@ -0,0 +1,165 @@
+# Cleans raw season CSVs from Sports Reference and combines them into stats.csv
+# and players.csv, or loads them straight into the database. Seasons are
+# cleaned in parallel, one process per file, with vectorized pandas operations.
+#
+#   python data/ingest.py data/raw/*.csv                          # writes data/stats.csv and data/players.csv
+#   python data/ingest.py data/raw/*.csv --clean-dir data/clean   # ... plus <year>_clean.csv for each season
+#   python data/ingest.py data/raw/2024.csv --load                # adds or replaces the 2024 season in the database
+#
+# Loading is safe while the API is running: the season appears to searches and
+# drafts at once, when the load commits.
+#
+# The season year is taken from the file name.
+
+# import modules
+import argparse
+import io
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas
+import psycopg2
+import loader
+
+DATA_DIR = Path(__file__).resolve().parent
+
+FANTASY_COLUMNS = {
+    "fantasy_points_standard": "fantasy_points_standard_10",
+    "fantasy_points_ppr": "fantasy_points_ppr_10"
+}
+
+# API workers listen on this channel to reload the player data
+PLAYER_DATA_CHANNEL = "player_data"
+
+# Pro Football Reference marks Pro Bowl (*) and All-Pro (+) selections after the name
+NAME_MARKERS = ["*", "+"]
+
+
+def season_year(path):
+    match = re.search(r"(\d{4})", Path(path).stem)
+    if match is None:
+        raise ValueError(f"Cannot tell the season of {path}; the file name must contain the year")
+    return match.group(1)
+
+
+def clean_season(path):
+    """
+    Applies the cleaning rules to one raw season file: strips the * and + markers from names, counts fullbacks as
+    running backs, fills blank values with 0, stores fantasy points multiplied by 10 as integers, and adds the year.
+    """
+
+    season = pandas.read_csv(path, dtype=str, keep_default_na=False, skip_blank_lines=True)
+
+    name = season["name"]
+    # at most two markers, and only on names longer than two characters
+    long_name = name.str.len() > 2
+    for _ in range(2):
+        marked = long_name & name.str[-1].isin(NAME_MARKERS)
+        name = name.where(~marked, name.str[:-1])
+    season["name"] = name
+
+    values = season.columns.drop("name")
+    season[values] = season[values].replace("", "0")
+
+    season["position"] = season["position"].replace("FB", "RB")
+
+    for column, column_10 in FANTASY_COLUMNS.items():
+        # float multiplication truncated towards zero, as int(float(points) * 10)
+        season[column] = (season[column].astype(float) * 10).astype("int64").astype(str)
+    season = season.rename(columns=FANTASY_COLUMNS)
+
+    season["year"] = season_year(path)
+    return season
+
+
+def clean_seasons(paths, workers=None):
+    """
+    Cleans every season file in parallel and returns them as one frame, in year order.
+    """
+
+    paths = sorted(paths, key=season_year)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        seasons = list(executor.map(clean_season, paths))
+    return pandas.concat(seasons, ignore_index=True)
+
+
+def stats_and_players(seasons):
+    stats = seasons.drop(columns=["name"])
+    players = seasons[["player_id", "name"]].drop_duplicates().rename(columns={"name": "player_name"})
+    return stats, players
+
+
+def copy_frame(cursor, table, frame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ", ".join(f'"{column}"' for column in frame.columns)
+    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer, size=loader.COPY_CHUNK_SIZE)
+
+
+def load_database(stats, players):
+    """
+    Adds the seasons to the database, replacing any season that is already there, and refreshes the materialized
+    views built on them. Players already in the database keep their row.
+
+    Everything commits at once, and the views are refreshed concurrently, so searches and picks keep reading the
+    previous data until then. On commit the API workers are notified to reload their copies of the player data.
+    """
+
+    connection = psycopg2.connect(loader.connection_url())
+    try:
+        with connection, connection.cursor() as cursor:
+            cursor.execute("CREATE TEMPORARY TABLE season_players (LIKE players) ON COMMIT DROP")
+            cursor.execute("CREATE TEMPORARY TABLE season_stats (LIKE stats) ON COMMIT DROP")
+            copy_frame(cursor, "season_players", players)
+            copy_frame(cursor, "season_stats", stats)
+
+            cursor.execute("""
+                INSERT INTO players (player_id, player_name)
+                SELECT player_id, player_name FROM season_players
+                ON CONFLICT (player_id) DO NOTHING
+            """)
+            cursor.execute("""
+                DELETE FROM stats WHERE year IN (SELECT DISTINCT year FROM season_stats)
+            """)
+            cursor.execute("""
+                INSERT INTO stats SELECT * FROM season_stats
+            """)
+
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY player_points")
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY player_positions")
+
+            # delivered on commit; see src/player_data.py
+            cursor.execute("SELECT pg_notify(%s, %s)", (PLAYER_DATA_CHANNEL, json.dumps({"years": sorted(int(year) for year in stats["year"].unique())})))
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean raw season CSVs and write stats.csv/players.csv or load them into the database.")
+    parser.add_argument("files", nargs="+", type=Path, help="raw season CSVs, named after their year (e.g. raw/2023.csv)")
+    parser.add_argument("--out-dir", type=Path, default=DATA_DIR, help="where stats.csv and players.csv are written")
+    parser.add_argument("--clean-dir", type=Path, help="also write each cleaned season to <year>_clean.csv in this directory")
+    parser.add_argument("--load", action="store_true", help="load the seasons into the database instead of writing stats.csv/players.csv")
+    parser.add_argument("--workers", type=int, help="number of processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    seasons = clean_seasons(args.files, args.workers)
+
+    if args.clean_dir is not None:
+        for year, season in seasons.groupby("year", sort=True):
+            season.to_csv(args.clean_dir / f"{year}_clean.csv", index=False)
+
+    stats, players = stats_and_players(seasons)
+    if args.load:
+        load_database(stats, players)
+        print(f"Loaded {len(stats):,} player seasons for {len(players):,} players into the database")
+    else:
+        stats.to_csv(args.out_dir / "stats.csv", index=False)
+        players.to_csv(args.out_dir / "players.csv", index=False)
+        print(f"Wrote {len(stats):,} player seasons and {len(players):,} players to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# Builds a MockMaster database from scratch in one command: creates the tables
+# from schema.sql, streams the player data (and optionally the fake load data)
+# in with COPY, then creates the keys, indexes, materialized views and functions.
+#
+#   python data/loader.py                  # schema + players.csv/stats.csv
+#   python data/loader.py --fake           # ... plus data/fake/fake_*.csv
+#   python data/loader.py --drop --fake    # rebuild an existing database
+
+# import modules
+import argparse
+import glob
+import os
+import re
+import time
+from pathlib import Path
+import dotenv
+import psycopg2
+import sqlalchemy
+
+DATA_DIR = Path(__file__).resolve().parent
+SCHEMA_PATH = DATA_DIR.parent / "schema.sql"
+
+# files are read and sent to the server in chunks of this many bytes
+COPY_CHUNK_SIZE = 1 << 20
+
+PLAYER_DATA = [
+    ("players", "players.csv"),
+    ("stats", "stats.csv")
+]
+
+# each table may be split into shards (fake_teams_000.csv, fake_teams_001.csv, ...)
+FAKE_TABLES = ["drafts", "position_requirements", "teams", "pick_schedule", "selections"]
+
+
+def connection_url():
+    dotenv.load_dotenv()
+    url = sqlalchemy.engine.make_url(os.environ["POSTGRES_URI"])
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def split_statements(sql):
+    """
+    Splits a SQL script into statements at semicolons that end a line outside of $$-quoted function bodies.
+    Comment lines outside function bodies are dropped.
+    """
+
+    statements = []
+    current = []
+    in_body = False
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not in_body and (stripped == "" or stripped.startswith("--")):
+            continue
+        current.append(line)
+        if line.count("$$") % 2 == 1:
+            in_body = not in_body
+        if not in_body and stripped.endswith(";"):
+            statements.append("\n".join(current))
+            current = []
+    return statements
+
+
+def is_table(statement):
+    return re.match(r"create\s+table\b", statement.strip(), re.IGNORECASE) is not None
+
+
+def split_constraints(statement):
+    """
+    Splits a create table statement into the statement without its constraints and the ALTER TABLE statements
+    that add them back, so that keys are built and checked once over the loaded data instead of row by row.
+    """
+
+    table = re.match(r"create\s+table\s+(public\.\w+)", statement.strip(), re.IGNORECASE).group(1)
+    lines = []
+    constraints = []
+    for line in statement.splitlines():
+        if line.strip().lower().startswith("constraint "):
+            constraints.append(f"ALTER TABLE {table} ADD {line.strip().rstrip(',')}")
+        else:
+            lines.append(line)
+
+    # the last column now ends the column list
+    closing = next(i for i, line in enumerate(lines) if line.strip().startswith(")"))
+    lines[closing - 1] = lines[closing - 1].rstrip().rstrip(",")
+    return "\n".join(lines), constraints
+
+
+def drop_existing(cursor, statements):
+    """
+    Drops every table and materialized view that schema.sql creates, along with everything that depends on them.
+    """
+
+    for statement in statements:
+        table = re.match(r"create\s+table\s+(?:public\.)?(\w+)", statement.strip(), re.IGNORECASE)
+        view = re.match(r"create\s+materialized\s+view\s+(?:public\.)?(\w+)", statement.strip(), re.IGNORECASE)
+        if view:
+            cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view.group(1)} CASCADE")
+        elif table:
+            cursor.execute(f"DROP TABLE IF EXISTS {table.group(1)} CASCADE")
+
+
+def copy_csv(cursor, table, path):
+    """
+    Streams a CSV file into a table with COPY, using the CSV header as the column list. Returns the number of rows.
+    """
+
+    with open(path, newline="") as file:
+        header = file.readline().strip()
+        columns = ", ".join(f'"{column}"' for column in header.split(","))
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", file, size=COPY_CHUNK_SIZE)
+    return cursor.rowcount
+
+
+def load_table(cursor, table, paths):
+    start = time.perf_counter()
+    rows = sum(copy_csv(cursor, table, path) for path in paths)
+    print(f"Loaded {rows:,} rows into {table} in {time.perf_counter() - start:.1f}s")
+
+
+def fake_data_paths(fake_dir, table):
+    paths = sorted(glob.glob(str(fake_dir / f"fake_{table}.csv")) + glob.glob(str(fake_dir / f"fake_{table}_*.csv")))
+    if not paths:
+        raise SystemExit(f"No fake data for {table} in {fake_dir}; run data/generator.py first")
+    return paths
+
+
+def reset_identity_sequences(cursor):
+    """
+    Moves every identity sequence past the largest id loaded, so rows created through the API do not collide with it.
+    """
+
+    cursor.execute("""
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND is_identity = 'YES'
+    """)
+    for table, column in cursor.fetchall():
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence('public.{table}', '{column}'), COALESCE(MAX({column}), 0) + 1, false)
+            FROM {table}
+        """)
+
+
+def backfill_counters(cursor):
+    """
+    Sets team_count and pick_count of every draft in one pass. Nothing else is writing during a load, so unlike
+    python -m src.maintenance backfill-counters this does not need to work in batches.
+    """
+
+    cursor.execute("""
+        WITH team_counts AS (
+            SELECT draft_id, COUNT(*) AS team_count FROM teams GROUP BY draft_id
+        ), pick_counts AS (
+            SELECT draft_id, COUNT(*) AS pick_count FROM selections GROUP BY draft_id
+        )
+        UPDATE drafts
+        SET team_count = COALESCE(team_counts.team_count, 0), pick_count = COALESCE(pick_counts.pick_count, 0)
+        FROM drafts AS counted
+        LEFT JOIN team_counts ON counted.draft_id = team_counts.draft_id
+        LEFT JOIN pick_counts ON counted.draft_id = pick_counts.draft_id
+        WHERE drafts.draft_id = counted.draft_id
+    """)
+
+
+def load(fake=False, drop=False, fake_dir=DATA_DIR / "fake", url=None):
+    statements = split_statements(SCHEMA_PATH.read_text())
+    tables = []
+    keys = []
+    foreign_keys = []
+    for statement in statements:
+        if is_table(statement):
+            table, constraints = split_constraints(statement)
+            tables.append(table)
+            keys.extend(constraint for constraint in constraints if "foreign key" not in constraint.lower())
+            foreign_keys.extend(constraint for constraint in constraints if "foreign key" in constraint.lower())
+    # keys, indexes, materialized views and functions are created once the data is in
+    deferred = keys + foreign_keys + [statement for statement in statements if not is_table(statement)]
+
+    start = time.perf_counter()
+    connection = psycopg2.connect(url or connection_url())
+    try:
+        # everything runs in one transaction, so a failed load leaves the database as it was
+        with connection, connection.cursor() as cursor:
+            if drop:
+                drop_existing(cursor, statements)
+
+            for statement in tables:
+                cursor.execute(statement)
+
+            for table, file_name in PLAYER_DATA:
+                load_table(cursor, table, [DATA_DIR / file_name])
+
+            if fake:
+                for table in FAKE_TABLES:
+                    load_table(cursor, table, fake_data_paths(fake_dir, table))
+
+            step = time.perf_counter()
+            for statement in deferred:
+                cursor.execute(statement)
+            print(f"Built keys, indexes, materialized views and functions in {time.perf_counter() - step:.1f}s")
+
+            reset_identity_sequences(cursor)
+            backfill_counters(cursor)
+
+        # statistics for the planner on the freshly loaded tables
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    finally:
+        connection.close()
+
+    print(f"Database loaded in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the MockMaster schema and bulk load its data.")
+    parser.add_argument("--fake", action="store_true", help="also load the fake load data from data/fake")
+    parser.add_argument("--fake-dir", type=Path, default=DATA_DIR / "fake", help="directory holding the fake_*.csv files")
+    parser.add_argument("--drop", action="store_true", help="drop the existing tables and materialized views first")
+    args = parser.parse_args()
+
+    load(fake=args.fake, drop=args.drop, fake_dir=args.fake_dir)
@@ -0,0 +1,36 @@
+-- Adds pick_schedule to an existing database and fills in the snake order of every draft that has
+-- already been started, which start_draft would otherwise have written. Run it once, in a single
+-- transaction. Part 4 of schema.sql is re-run after the last migration (see README.md).
+
+begin;
+
+create table if not exists
+  public.pick_schedule (
+    draft_id bigint not null,
+    pick_number integer not null,
+    team_id bigint not null,
+    constraint pick_schedule_pkey primary key (draft_id, pick_number),
+    constraint pick_schedule_draft_id_fkey foreign key (draft_id) references drafts (draft_id),
+    constraint pick_schedule_team_id_fkey foreign key (team_id) references teams (team_id)
+  ) tablespace pg_default;
+
+insert into pick_schedule (draft_id, pick_number, team_id)
+select drafts.draft_id, picks.pick_number, teams.team_id
+from drafts
+cross join lateral (
+  select count(*)::integer as number_of_teams
+  from teams
+  where teams.draft_id = drafts.draft_id
+) as team_counts
+cross join lateral generate_series(1, team_counts.number_of_teams * drafts.roster_size) as picks (pick_number)
+join teams
+  on teams.draft_id = drafts.draft_id
+  and teams.draft_position = case
+    when ((picks.pick_number - 1) / team_counts.number_of_teams) % 2 = 1
+      then team_counts.number_of_teams - ((picks.pick_number - 1) % team_counts.number_of_teams)
+    else ((picks.pick_number - 1) % team_counts.number_of_teams) + 1
+  end
+where drafts.draft_status <> 'pending'
+on conflict do nothing;
+
+commit;
@@ -0,0 +1,9 @@
+-- Adds the team_count and pick_count counters to drafts. Both start at zero, so run
+--   python -m src.maintenance backfill-counters
+-- once Part 4 of schema.sql has been re-run after the last migration (see README.md), so that draft_pick
+-- keeps pick_count up to date from then on.
+-- python -m src.maintenance check-counters reports any draft whose counters disagree with its teams and selections.
+
+alter table public.drafts
+  add column if not exists team_count integer not null default 0,
+  add column if not exists pick_count integer not null default 0;
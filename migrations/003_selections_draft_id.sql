@@ -0,0 +1,60 @@
+-- Adds draft_id to selections so a draft's picks can be found, and double drafting prevented, without
+-- going through teams. Run the steps in order with psql in autocommit mode (the backfill commits per
+-- batch and the indexes are built concurrently). Part 4 of schema.sql is re-run after the last migration
+-- (see README.md); draft_pick only starts writing draft_id after that, so live drafts stay paused until then.
+
+-- 1. nullable for now, so the column is added without rewriting the table
+alter table public.selections add column if not exists draft_id bigint;
+
+-- 2. backfill in batches of drafts, committing after each one so live picks are only ever blocked briefly
+do $$
+declare
+  batch_size constant integer := 500;
+  batch_start bigint;
+  last_draft_id bigint;
+begin
+  select min(draft_id), max(draft_id) into batch_start, last_draft_id from drafts;
+
+  while batch_start <= last_draft_id loop
+    update selections
+    set draft_id = teams.draft_id
+    from teams
+    where selections.team_id = teams.team_id
+      and selections.draft_id is null
+      and teams.draft_id >= batch_start
+      and teams.draft_id < batch_start + batch_size;
+
+    commit;
+    batch_start := batch_start + batch_size;
+  end loop;
+end;
+$$;
+
+-- 3. the same player drafted twice in one draft breaks the new unique constraint; keep the earliest pick
+--    (run python -m src.maintenance backfill-counters afterwards if any were removed)
+delete from selections
+using selections as earlier
+where selections.draft_id = earlier.draft_id
+  and selections.player_id = earlier.player_id
+  and selections.when_selected > earlier.when_selected;
+
+create unique index concurrently if not exists selections_draft_id_player_id_key on public.selections (draft_id, player_id);
+create index concurrently if not exists selections_draft_id_when_selected_index on public.selections (draft_id, when_selected);
+
+-- 4. catch picks made during the backfill, then enforce the column
+begin;
+
+update selections
+set draft_id = teams.draft_id
+from teams
+where selections.team_id = teams.team_id
+  and selections.draft_id is null;
+
+alter table public.selections
+  alter column draft_id set not null,
+  add constraint selections_draft_id_player_id_key unique using index selections_draft_id_player_id_key,
+  add constraint selections_draft_id_fkey foreign key (draft_id) references drafts (draft_id);
+
+drop index if exists selections_team_id_when_selected_index;
+
+commit;
@@ -0,0 +1,5 @@
+-- Indexes teams by draft. start_draft, join_draft_room, draft_player and the draft order all look teams up by
+-- draft_id, and without this index each of those lookups scans the whole table. Built concurrently so joins and
+-- picks keep running; run it outside of a transaction block.
+
+create index concurrently if not exists teams_draft_id_index on public.teams (draft_id, draft_position);
@@ -0,0 +1,6 @@
+-- Adds the unique indexes that REFRESH MATERIALIZED VIEW CONCURRENTLY needs, so that data/ingest.py --load can
+-- refresh player_points and player_positions after adding a season without blocking searches and picks.
+-- Run it outside of a transaction block.
+
+create unique index concurrently if not exists player_points_player_id_year_index on public.player_points (player_id, year);
+create unique index concurrently if not exists player_positions_player_id_index on public.player_positions (player_id);
@@ -0,0 +1,5 @@
+-- Indexes pending drafts for the lobby, which pages through them newest first. Without it every page scans the
+-- whole drafts table, which keeps growing with ended and abandoned drafts. Built concurrently so drafts can still
+-- be created and started; run it outside of a transaction block.
+
+create index concurrently if not exists drafts_pending_index on public.drafts (draft_id) where draft_status = 'pending';
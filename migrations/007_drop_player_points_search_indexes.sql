@@ -0,0 +1,12 @@
+-- Drops the keyset pagination indexes on player_points. Player search is served from the in-process player index
+-- (src/player_index.py), so nothing reads them, and every REFRESH MATERIALIZED VIEW CONCURRENTLY during an ingest
+-- has to maintain them. player_points_player_id_year_index stays: the concurrent refresh needs it. Dropped
+-- concurrently so searches keep running; run it outside of a transaction block.
+
+drop index concurrently if exists player_points_player_name_index;
+drop index concurrently if exists player_points_year_index;
+drop index concurrently if exists player_points_age_index;
+drop index concurrently if exists player_points_position_index;
+drop index concurrently if exists player_points_team_index;
+drop index concurrently if exists player_points_standard_index;
+drop index concurrently if exists player_points_ppr_index;
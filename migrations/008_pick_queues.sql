@@ -0,0 +1,15 @@
+-- Adds the pick queues that draft_pick_with_queues and draft_queued_picks draft from. Those functions read
+-- pick_queues whenever a pick is made or a draft is started or resumed, so apply this before re-running Part 4
+-- of schema.sql (see README.md).
+
+create table if not exists
+  public.pick_queues (
+    team_id bigint not null,
+    player_id text not null,
+    rank integer not null,
+    constraint pick_queues_pkey primary key (team_id, player_id),
+    constraint pick_queues_player_id_fkey foreign key (player_id) references players (player_id),
+    constraint pick_queues_team_id_fkey foreign key (team_id) references teams (team_id)
+  ) tablespace pg_default;
+
+create index if not exists pick_queues_team_id_rank_index on public.pick_queues (team_id, rank);
@@ -8,10 +8,15 @@ create table
     roster_size integer not null,
     draft_size integer not null,
     draft_status text not null default 'pending'::text,
+    team_count integer not null default 0,
+    pick_count integer not null default 0,
     constraint drafts_pkey primary key (draft_id),
     constraint drafts_draft_id_key unique (draft_id)
   ) tablespace pg_default;
 
+-- the lobby pages through pending drafts, newest first; ended drafts make up almost all of the table
+create index drafts_pending_index on public.drafts (draft_id) where draft_status = 'pending';
+
 create table
   public.position_requirements (
     draft_id bigint not null,
@@ -35,6 +40,9 @@ create table
     constraint teams_draft_id_fkey foreign key (draft_id) references drafts (draft_id)
   ) tablespace pg_default;
 
+-- every draft endpoint looks teams up by draft, and the draft order reads them by draft_position
+create index teams_draft_id_index on public.teams (draft_id, draft_position);
+
 create table
   public.players (
     player_name text not null,
@@ -77,27 +85,51 @@ create table
     team_id bigint not null,
     player_id text not null,
     when_selected integer not null,
+    draft_id bigint not null,
     constraint selections_pkey primary key (team_id, player_id),
+    constraint selections_draft_id_player_id_key unique (draft_id, player_id),
+    constraint selections_draft_id_fkey foreign key (draft_id) references drafts (draft_id),
     constraint selections_player_id_fkey foreign key (player_id) references players (player_id),
     constraint selections_team_id_fkey foreign key (team_id) references teams (team_id)
   ) tablespace pg_default;
 
+create index selections_draft_id_when_selected_index on public.selections (draft_id, when_selected);
+
+create table
+  public.pick_schedule (
+    draft_id bigint not null,
+    pick_number integer not null,
+    team_id bigint not null,
+    constraint pick_schedule_pkey primary key (draft_id, pick_number),
+    constraint pick_schedule_draft_id_fkey foreign key (draft_id) references drafts (draft_id),
+    constraint pick_schedule_team_id_fkey foreign key (team_id) references teams (team_id)
+  ) tablespace pg_default;
+
+create table
+  public.pick_queues (
+    team_id bigint not null,
+    player_id text not null,
+    rank integer not null,
+    constraint pick_queues_pkey primary key (team_id, player_id),
+    constraint pick_queues_player_id_fkey foreign key (player_id) references players (player_id),
+    constraint pick_queues_team_id_fkey foreign key (team_id) references teams (team_id)
+  ) tablespace pg_default;
+
+create index pick_queues_team_id_rank_index on public.pick_queues (team_id, rank);
+
 -- Part 2: Populating initial player data
--- 1) Navigate to your instance of Supabase 
--- 2) Click on the "players" table
--- 3) Click "Insert" and "Import" data from CSV 
--- 4) Use "players.csv" file from the data folder of the repository
--- 5) Click "Import Data"
--- 6) Click on the "stats" table
--- 7) Click "Insert" and "Import" data from CSV 
--- 8) Use "stats.csv" file from the data folder of the repository
--- 9) Click "Import Data"
--- Now your local database will have all the necassary fantasy football player data for the 2019-2023 seasons
+-- Run "python data/loader.py" with POSTGRES_URI set (or in .env). It creates the tables above, loads
+-- "players.csv" and "stats.csv" from the data folder of the repository with COPY, and then runs Parts 3
+-- and 4. Add --fake to also load the fake drafts that "python data/generator.py" writes to data/fake, and --drop
+-- to rebuild an existing database.
+-- Now your local database will have all the necassary fantasy football player data for the 2019-2023 seasons.
+-- Later seasons are added with "python data/ingest.py <season files> --load" while the API keeps running.
 
 -- Part 3: Creating the materialized views. 
 
 -- Creating the materialized view for search players endpoint. 
--- NOTE: Once the initial data is imported, the materialized view never needs to be updated.
+-- NOTE: "python data/ingest.py <season files> --load" refreshes both materialized views concurrently after
+-- adding a season, which needs the unique index on each of them.
 create materialized view
   public.player_points as
 select
@@ -113,8 +145,10 @@ from
   stats
   join players on stats.player_id = players.player_id;
 
+-- search is served from the in-process player_index, so the unique index needed by the concurrent refresh is the only one
+create unique index player_points_player_id_year_index on public.player_points (player_id, year);
+
 -- Creating the materialized view for draft players endpoint. 
--- NOTE: Once the initial data is imported, the materialized view never needs to be updated.
 create materialized view
   public.player_positions as
 with recent_stats as (
@@ -130,3 +164,257 @@ from
   join recent_stats on players.player_id = recent_stats.player_id
 where
   recent_stats.n = 1;
+
+create unique index player_positions_player_id_index on public.player_positions (player_id);
+
+-- Part 4: Creating the database functions.
+
+-- Returns the pick number and team of the pick that is on the clock in a draft, or no row when the draft
+-- has not been started or every pick has been made. Reads the draft's pick_count and the pick_schedule
+-- entry after it, both by primary key.
+create or replace function
+  public.draft_current_pick(clock_draft_id bigint)
+returns table (pick_number integer, team_id bigint)
+language sql
+stable
+as $$
+  select pick_schedule.pick_number, pick_schedule.team_id
+  from drafts
+  join pick_schedule
+    on pick_schedule.draft_id = drafts.draft_id
+    and pick_schedule.pick_number = drafts.pick_count + 1
+  where drafts.draft_id = clock_draft_id
+$$;
+
+-- Drafts a player in a single round trip. Picks are serialized per draft with a transaction-scoped
+-- advisory lock keyed on draft_id, so concurrent picks in the same draft wait on each other while
+-- picks in different drafts never conflict. Returns the HTTP status code and detail for the pick.
+create or replace function
+  public.draft_pick(pick_team_id bigint, pick_player_id text)
+returns table (status_code integer, detail text, when_selected integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  pick_draft_id bigint;
+  pick_draft_status text;
+  pick_roster_size integer;
+  pick_position text;
+  current_pick integer;
+  current_team_id bigint;
+  remaining_picks integer;
+  positions_needed jsonb;
+  total_needed_picks integer;
+  current_count integer;
+  max_allowed integer;
+  next_team_id bigint;
+begin
+  select teams.draft_id into pick_draft_id
+  from teams
+  where teams.team_id = pick_team_id;
+
+  if not found then
+    return query select 404, 'Team not found', null::integer;
+    return;
+  end if;
+
+  perform pg_advisory_xact_lock(pick_draft_id);
+
+  -- pausing and ending a draft update the drafts row without the advisory lock, so the row lock makes a
+  -- status change either commit before the checks below or wait until this pick commits
+  select drafts.draft_status, drafts.roster_size
+  into pick_draft_status, pick_roster_size
+  from drafts
+  where drafts.draft_id = pick_draft_id
+  for update;
+
+  if pick_draft_status <> 'active' then
+    return query select 409, 'Draft not active', null::integer;
+    return;
+  end if;
+
+  select player_positions."position" into pick_position
+  from player_positions
+  where player_positions.player_id = pick_player_id;
+
+  if not found then
+    return query select 404, 'Player not found', null::integer;
+    return;
+  end if;
+
+  select clock.pick_number, clock.team_id into current_pick, current_team_id
+  from draft_current_pick(pick_draft_id) as clock;
+
+  -- once the schedule is exhausted every roster is full, which the remaining picks check reports
+  if current_team_id <> pick_team_id then
+    return query select 403, 'Not your turn to draft', null::integer;
+    return;
+  end if;
+
+  select pick_roster_size - count(*) into remaining_picks
+  from selections
+  where selections.team_id = pick_team_id;
+
+  if remaining_picks <= 0 then
+    return query select 409, 'No remaining picks for this team', null::integer;
+    return;
+  end if;
+
+  with counter as (
+    select player_positions."position", count(*) as num_selected
+    from selections
+    join player_positions on selections.player_id = player_positions.player_id
+    where selections.team_id = pick_team_id
+    group by player_positions."position"
+  )
+  select
+    jsonb_object_agg(position_requirements."position", greatest(0, position_requirements.min - coalesce(counter.num_selected, 0))),
+    sum(greatest(0, position_requirements.min - coalesce(counter.num_selected, 0))),
+    max(coalesce(counter.num_selected, 0)) filter (where position_requirements."position" = pick_position),
+    max(position_requirements.max) filter (where position_requirements."position" = pick_position)
+  into positions_needed, total_needed_picks, current_count, max_allowed
+  from position_requirements
+  left join counter on position_requirements."position" = counter."position"
+  where position_requirements.draft_id = pick_draft_id;
+
+  if total_needed_picks >= remaining_picks and coalesce((positions_needed ->> pick_position)::integer, 0) < 1 then
+    return query select 409, 'Cannot draft player; minimum positions not met. Current requirements:' || positions_needed::text, null::integer;
+    return;
+  elsif current_count >= max_allowed then
+    return query select 409, 'Maximum number of ' || pick_position || ' players reached', null::integer;
+    return;
+  end if;
+
+  -- the unique (draft_id, player_id) constraint is what keeps a player from being drafted twice
+  insert into selections (draft_id, team_id, player_id, when_selected)
+  values (pick_draft_id, pick_team_id, pick_player_id, current_pick)
+  on conflict (draft_id, player_id) do nothing;
+
+  if not found then
+    return query select 409, 'Player already drafted in this draft', null::integer;
+    return;
+  end if;
+
+  update drafts set pick_count = pick_count + 1
+  where drafts.draft_id = pick_draft_id;
+
+  select pick_schedule.team_id into next_team_id
+  from pick_schedule
+  where pick_schedule.draft_id = pick_draft_id and pick_schedule.pick_number = current_pick + 1;
+
+  -- delivered to listeners only when the transaction commits
+  perform pg_notify('draft_events', json_build_object(
+    'draft_id', pick_draft_id,
+    'event', 'pick',
+    'team_id', pick_team_id,
+    'player_id', pick_player_id,
+    'position', pick_position,
+    'selection', current_pick,
+    'next_team_id', next_team_id
+  )::text);
+
+  return query select 200, 'Player drafted successfully', current_pick;
+end;
+$$;
+
+-- Drafts from the pick queues of the teams on the clock. Starting with the team whose turn it is,
+-- takes the highest ranked queued player that draft_pick accepts, then moves on to the next team,
+-- until a team has no acceptable queued player or the draft is no longer active. Returns the picks made.
+create or replace function
+  public.draft_queued_picks(queue_draft_id bigint)
+returns table (team_id bigint, player_id text, when_selected integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  queue_draft_status text;
+  current_team_id bigint;
+  queued record;
+  attempt record;
+  picked boolean;
+begin
+  perform pg_advisory_xact_lock(queue_draft_id);
+
+  loop
+    -- locked for the same reason as in draft_pick
+    select drafts.draft_status into queue_draft_status
+    from drafts
+    where drafts.draft_id = queue_draft_id
+    for update;
+
+    exit when queue_draft_status is distinct from 'active';
+
+    current_team_id := null;
+    select clock.team_id into current_team_id
+    from draft_current_pick(queue_draft_id) as clock;
+
+    exit when current_team_id is null;
+
+    picked := false;
+    for queued in
+      select pick_queues.player_id
+      from pick_queues
+      where pick_queues.team_id = current_team_id
+      order by pick_queues.rank
+    loop
+      select * into attempt from draft_pick(current_team_id, queued.player_id);
+      if attempt.status_code = 200 then
+        delete from pick_queues
+        where pick_queues.team_id = current_team_id and pick_queues.player_id = queued.player_id;
+        return query select current_team_id, queued.player_id, attempt.when_selected;
+        picked := true;
+        exit;
+      end if;
+    end loop;
+
+    exit when not picked;
+  end loop;
+end;
+$$;
+
+-- Drafts a player and then lets any queued teams that are next on the clock draft automatically, all in
+-- one call. The first row is the result of the requested pick; any further rows are picks made from queues.
+create or replace function
+  public.draft_pick_with_queues(pick_team_id bigint, pick_player_id text)
+returns table (status_code integer, detail text, team_id bigint, player_id text, when_selected integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+  pick record;
+begin
+  select * into pick from draft_pick(pick_team_id, pick_player_id);
+  return query select pick.status_code, pick.detail, pick_team_id, pick_player_id, pick.when_selected;
+
+  if pick.status_code = 200 then
+    return query
+      select 200, 'Player drafted from queue', queued.team_id, queued.player_id, queued.when_selected
+      from teams
+      cross join lateral draft_queued_picks(teams.draft_id) as queued
+      where teams.team_id = pick_team_id;
+  end if;
+end;
+$$;
+
+-- Publishes draft status changes (start, pause, resume, end) on the draft_events channel.
+create or replace function
+  public.notify_draft_status()
+returns trigger
+language plpgsql
+as $$
+begin
+  perform pg_notify('draft_events', json_build_object(
+    'draft_id', new.draft_id,
+    'event', 'status',
+    'draft_status', new.draft_status,
+    'next_team_id', case when new.draft_status = 'active' then (select clock.team_id from draft_current_pick(new.draft_id) as clock) end
+  )::text);
+  return new;
+end;
+$$;
+
+create or replace trigger drafts_status_notify
+after update of draft_status on public.drafts
+for each row
+when (old.draft_status is distinct from new.draft_status)
+execute function notify_draft_status();
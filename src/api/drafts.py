@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from src.api import auth
+from src.api import responses
 import sqlalchemy
 from src import database as db
+from src import draft_state
+from src import draft_events
+from src import pick_schedule
+from src import position_requirements
 from pydantic import BaseModel, Field, conint
 from typing import Literal
-from enum import Enum
+from enum import Enum, IntEnum
 from sqlalchemy import exc
+import asyncio
 
 router = APIRouter(
     prefix="/drafts",
@@ -18,6 +25,11 @@ class DraftType(str, Enum):
     PPR = 'PPR'
     Standard = 'Standard'
 
+class RosterSize(IntEnum):
+    eight = 8
+    ten = 10
+    twelve = 12
+
 class DraftRequest(BaseModel):
     draft_type: DraftType
     draft_name: str = Field(..., min_length=3, max_length=30)
@@ -29,34 +41,40 @@ class JoinDraftRequest(BaseModel):
     user_name: str = Field(..., min_length=3, max_length=14)
 
 @router.post("/{draft_id}/join")
-def join_draft_room(draft_id: int, join_request: JoinDraftRequest):
+async def join_draft_room(draft_id: int, join_request: JoinDraftRequest):
     """
     Adds a team to a specific draft. Assigns the team's initial name and the name of the user.
     """
 
+    async def join(connection):
+        # claims a seat and locks the draft row in one statement; concurrent joins queue on the row lock and
+        # re-check team_count < draft_size once it is released, so the draft cannot be overfilled
+        seat = (await connection.execute(sqlalchemy.text("""
+            UPDATE drafts SET team_count = team_count + 1
+            WHERE draft_id = :id AND draft_status = 'pending' AND team_count < draft_size
+            RETURNING team_count
+        """), {"id": draft_id})).fetchone()
+
+        if not seat:
+            draft = (await connection.execute(sqlalchemy.text("""
+                SELECT draft_status FROM drafts
+                WHERE draft_id = :id
+            """), {"id": draft_id})).fetchone()
+
+            if not draft or draft.draft_status != 'pending':
+                raise HTTPException(status_code=404, detail="Draft not found or not in a pending state")
+            raise HTTPException(status_code=400, detail="Draft is already full")
+
+        return (await connection.execute(sqlalchemy.text("""
+            INSERT INTO teams (draft_id, team_name, user_name)
+            VALUES (:id, :team, :user)
+            RETURNING team_id
+        """), {"id": draft_id, "team": join_request.team_name, "user": join_request.user_name})).scalar_one()
+
     try:
-        with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-            with connection.begin():
-                draft = connection.execute(sqlalchemy.text("""                               
-                    SELECT draft_size FROM drafts
-                    WHERE draft_id = :id AND draft_status = 'pending'
-                """), {"id": draft_id}).fetchone()
-
-                if not draft:
-                    raise HTTPException(status_code=404, detail="Draft not found or not in a pending state")
-
-                team_count = connection.execute(sqlalchemy.text("""
-                    SELECT COUNT(*) FROM teams WHERE draft_id = :id
-                """), {"id": draft_id}).scalar_one()
-
-                if team_count >= draft.draft_size:
-                    raise HTTPException(status_code=400, detail="Draft is already full")
-
-                team_id = connection.execute(sqlalchemy.text("""
-                    INSERT INTO teams (draft_id, team_name, user_name)
-                    VALUES (:id, :team, :user)
-                    RETURNING team_id
-                """), {"id": draft_id, "team": join_request.team_name, "user": join_request.user_name}).scalar_one()
+        team_id = await db.run_transaction("join_draft_room", join)
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft room with Draft ID {draft_id} is busy. Please try again.", headers={"Retry-After": "1"})
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Failed to Join Draft room with Draft ID {draft_id}. Please try again.")
     
@@ -64,31 +82,26 @@ def join_draft_room(draft_id: int, join_request: JoinDraftRequest):
 
 
 @router.post("/")
-def create_draft_room(draft_request: DraftRequest):
+async def create_draft_room(draft_request: DraftRequest):
     """
     Creates a draft room. Assigns the draft's type, name, and size. Also sets the positional requirements based on the roster size.
     """
 
-    positional_requirements = {
-        8: {'QB': (1, 3), 'RB': (1, 3), 'WR': (1, 3), 'TE': (1, 3)},
-        10: {'QB': (1, 4), 'RB': (1, 4), 'WR': (1, 4), 'TE': (1, 4)},
-        12: {'QB': (2, 4), 'RB': (2, 4), 'WR': (2, 4), 'TE': (2, 4)}
-    }
-    requirements = positional_requirements[draft_request.roster_size]
+    requirements = position_requirements.POSITIONAL_REQUIREMENTS[draft_request.roster_size]
 
     try:
-        with db.engine.begin() as connection:
+        async with db.async_engine.begin() as connection:
             id_sql = sqlalchemy.text("""
                 INSERT INTO drafts (draft_name, draft_type, roster_size, draft_size)
                 VALUES (:name, :type, :rsize, :dsize)
                 RETURNING draft_id
                 """)
             id_options = {"name": draft_request.draft_name, "type": draft_request.draft_type, "rsize": draft_request.roster_size, "dsize": draft_request.draft_size}
-            draft_id = connection.execute(id_sql, id_options).scalar_one()
+            draft_id = (await connection.execute(id_sql, id_options)).scalar_one()
             
             pos_reqs = [{'draft_id': draft_id, 'position': key, 'min': val[0], 'max': val[1]} for key, val in requirements.items()]
             
-            connection.execute(sqlalchemy.text("""
+            await connection.execute(sqlalchemy.text("""
                 INSERT INTO position_requirements (draft_id, position, min, max)
                 VALUES (:draft_id, :position, :min, :max)"""), pos_reqs)
     except exc.SQLAlchemyError:
@@ -98,257 +111,342 @@ def create_draft_room(draft_request: DraftRequest):
 
 
 @router.get("/")
-def get_draft_rooms():
+async def get_draft_rooms(
+    draft_type: DraftType = None,
+    draft_size: int = Query(default=None, ge=2, le=16),
+    roster_size: RosterSize = None,
+    min_open_seats: int = Query(default=0, ge=0),
+    cursor: int = Query(default=None, ge=1),
+    limit: int = Query(default=20, ge=1, le=100)
+):
     """
-    Retrieves all available drafts that have not yet been started. Acts as a list of drafts that are able to be joined.
+    Retrieves available drafts that have not yet been started, newest first, one page at a time. Acts as a list of drafts that
+    are able to be joined. Pass the returned next_cursor as cursor to get the following page; it is null on the last page.
     """
 
-    try: 
-        with db.engine.begin() as connection:
-            draft_rooms = connection.execute(sqlalchemy.text("""
-                SELECT draft_id, draft_name, draft_type, draft_size, roster_size
+    try:
+        async with db.read_transaction() as connection:
+            # drafts_pending_index holds only pending drafts in draft_id order, so a page reads about limit rows
+            # (more when the filters are selective) however many drafts there are
+            draft_rooms = responses.records(await connection.execute(sqlalchemy.text("""
+                SELECT draft_id, draft_name, draft_type, draft_size, roster_size, draft_size - team_count AS open_seats
                 FROM drafts
                 WHERE draft_status = 'pending'
-                """)).mappings().fetchall()
-            
-            draft_rooms_list = [
-                {"draft_id": room['draft_id'],
-                "draft_name": room['draft_name'],
-                "draft_type": room['draft_type'],
-                "draft_size": room['draft_size'],
-                "roster_size": room['roster_size']}
-                for room in draft_rooms
-            ]
+                    AND (CAST(:cursor AS bigint) IS NULL OR draft_id < :cursor)
+                    AND (CAST(:draft_type AS text) IS NULL OR draft_type = :draft_type)
+                    AND (CAST(:draft_size AS integer) IS NULL OR draft_size = :draft_size)
+                    AND (CAST(:roster_size AS integer) IS NULL OR roster_size = :roster_size)
+                    AND draft_size - team_count >= :min_open_seats
+                ORDER BY draft_id DESC
+                LIMIT :limit + 1
+                """), {
+                    "cursor": cursor,
+                    "draft_type": None if draft_type is None else draft_type.value,
+                    "draft_size": draft_size,
+                    "roster_size": None if roster_size is None else roster_size.value,
+                    "min_open_seats": min_open_seats,
+                    "limit": limit
+                }))
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail="Could not retrieve pending drafts. Please try again.")
 
-    return draft_rooms_list
+    # one row past the page tells whether there is another page
+    next_cursor = draft_rooms[limit - 1]["draft_id"] if len(draft_rooms) > limit else None
+    return responses.JSONBytesResponse({"drafts": draft_rooms[:limit], "next_cursor": next_cursor})
 
 
 @router.put("/{draft_id}/start")
-def start_draft(draft_id: int):
+async def start_draft(draft_id: int):
     """
     Starts the drafting process for a specified draft. This process also randomly assigns the draft order for all users in the draft.
     """
 
-    try: 
-        with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-            with connection.begin():
-                draft_lock = connection.execute(sqlalchemy.text("""
-                    SELECT draft_status
-                    FROM drafts
-                    WHERE drafts.draft_id = :draft_id
-                """), {'draft_id': draft_id}).fetchone()
-
-                draft_info = connection.execute(sqlalchemy.text("""
-                    SELECT COUNT(team_id) as team_count
-                    FROM drafts
-                    LEFT JOIN teams ON drafts.draft_id = teams.draft_id
-                    WHERE drafts.draft_id = :draft_id
-                    GROUP BY drafts.draft_status
-                """), {'draft_id': draft_id}).fetchone()
-                
-                if (not draft_lock) or (draft_lock.draft_status != 'pending'):
-                    raise HTTPException(status_code=404, detail="Draft not found or not in a pending state")
-
-                if draft_info.team_count == 0:
-                    raise HTTPException(status_code=400, detail="Cannot start a draft with no teams")
-
-                connection.execute(sqlalchemy.text("""
-                    WITH teams_list AS (
-                        SELECT team_id, ROW_NUMBER() OVER (ORDER BY random()) as position_num
-                        FROM teams 
-                        WHERE draft_id = :draft_id
-                    )
-                    UPDATE teams SET draft_position = teams_list.position_num
-                    FROM teams_list
-                    WHERE teams.team_id = teams_list.team_id;
-                                                   
-                    UPDATE drafts SET draft_status = 'active'
-                    WHERE draft_id = :draft_id;
-                """), {'draft_id': draft_id})
+    async def start(connection):
+        draft_lock = (await connection.execute(sqlalchemy.text("""
+            SELECT draft_status, roster_size, team_count
+            FROM drafts
+            WHERE drafts.draft_id = :draft_id
+        """), {'draft_id': draft_id})).fetchone()
+        
+        if (not draft_lock) or (draft_lock.draft_status != 'pending'):
+            raise HTTPException(status_code=404, detail="Draft not found or not in a pending state")
+
+        if draft_lock.team_count == 0:
+            raise HTTPException(status_code=400, detail="Cannot start a draft with no teams")
+
+        await connection.execute(sqlalchemy.text("""
+            WITH teams_list AS (
+                SELECT team_id, ROW_NUMBER() OVER (ORDER BY random()) as position_num
+                FROM teams 
+                WHERE draft_id = :draft_id
+            )
+            UPDATE teams SET draft_position = teams_list.position_num
+            FROM teams_list
+            WHERE teams.team_id = teams_list.team_id
+        """), {'draft_id': draft_id})
+
+        positions = pick_schedule.draft_positions(draft_lock.team_count, draft_lock.roster_size)
+        await connection.execute(sqlalchemy.text("""
+            INSERT INTO pick_schedule (draft_id, pick_number, team_id)
+            SELECT :draft_id, schedule.pick_number, teams.team_id
+            FROM unnest(CAST(:positions AS integer[])) WITH ORDINALITY AS schedule (draft_position, pick_number)
+            JOIN teams ON teams.draft_id = :draft_id AND teams.draft_position = schedule.draft_position
+        """), {'draft_id': draft_id, 'positions': positions})
+
+        await connection.execute(sqlalchemy.text("""
+            UPDATE drafts SET draft_status = 'active'
+            WHERE draft_id = :draft_id
+        """), {'draft_id': draft_id})
+
+        # teams on the clock with a pick queue draft straight away
+        await connection.execute(sqlalchemy.text("""
+            SELECT team_id, player_id, when_selected FROM draft_queued_picks(:draft_id)
+        """), {'draft_id': draft_id})
+
+    try:
+        await db.run_transaction("start_draft", start, isolation_level="SERIALIZABLE")
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft with Draft ID {draft_id} is busy. Please try again.", headers={"Retry-After": "1"})
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not start draft with Draft ID ${draft_id}. Please try again.")
 
+    draft_state.discard(draft_id)
     return {"success": True, "message": "Draft started and draft positions assigned randomly"}
 
 
 @router.put("/{draft_id}/pause")
-def pause_draft(draft_id: int):
+async def pause_draft(draft_id: int):
     """
     Changes the status of a specified draft from active to paused.
     """
 
-    try: 
-        with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-            with connection.begin():
-                result = connection.execute(sqlalchemy.text("""                                                    
-                    UPDATE drafts SET draft_status = 'paused' 
-                    WHERE draft_id = :draft_id AND draft_status = 'active'
-                    RETURNING draft_id
-                    """), {'draft_id': draft_id})
-
-                if result.rowcount == 0:
-                    raise HTTPException(status_code=404, detail="Draft not found or not active")
+    async def pause(connection):
+        result = await connection.execute(sqlalchemy.text("""
+            UPDATE drafts SET draft_status = 'paused' 
+            WHERE draft_id = :draft_id AND draft_status = 'active'
+            RETURNING draft_id
+            """), {'draft_id': draft_id})
+
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Draft not found or not active")
+
+    try:
+        await db.run_transaction("pause_draft", pause, isolation_level="SERIALIZABLE")
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft with Draft ID {draft_id} is busy. Please try again.", headers={"Retry-After": "1"})
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not pause draft with Draft ID {draft_id}. Please try again.")
 
+    draft_state.discard(draft_id)
     return {"success": True, "message": "Draft paused successfully"}
 
 
 @router.put("/{draft_id}/resume")
-def resume_draft(draft_id: int):
+async def resume_draft(draft_id: int):
     """
     Changes the status of a specified draft from paused to active.
     """
 
+    async def resume(connection):
+        result = await connection.execute(sqlalchemy.text("""
+            UPDATE drafts 
+            SET draft_status = 'active' 
+            WHERE draft_id = :draft_id AND draft_status = 'paused'
+            RETURNING draft_id
+        """), {'draft_id': draft_id})
+
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Draft not found or not in a paused state")
+
+        # teams on the clock with a pick queue draft straight away
+        await connection.execute(sqlalchemy.text("""
+            SELECT team_id, player_id, when_selected FROM draft_queued_picks(:draft_id)
+        """), {'draft_id': draft_id})
+
     try:
-        with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-            with connection.begin():
-                result = connection.execute(sqlalchemy.text("""                                                    
-                    UPDATE drafts 
-                    SET draft_status = 'active' 
-                    WHERE draft_id = :draft_id AND draft_status = 'paused'
-                    RETURNING draft_id
-                """), {'draft_id': draft_id})
-
-                if result.rowcount == 0:
-                    raise HTTPException(status_code=404, detail="Draft not found or not in a paused state")
+        await db.run_transaction("resume_draft", resume, isolation_level="SERIALIZABLE")
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft with Draft ID {draft_id} is busy. Please try again.", headers={"Retry-After": "1"})
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not resume draft with Draft ID {draft_id}. Please try again.")
 
+    draft_state.discard(draft_id)
     return {"success": True, "message": "Draft resumed successfully"}
 
 
 @router.put("/{draft_id}/end")
-def end_draft(draft_id: int):
+async def end_draft(draft_id: int):
     """
     Ends the drafting process by changing the status of a specified draft from active to ended. An ended draft cannot be resumed.
     """
 
+    async def end(connection):
+        result = await connection.execute(sqlalchemy.text("""
+            UPDATE drafts SET draft_status = 'ended' 
+            WHERE draft_id = :draft_id AND draft_status = 'active'
+            RETURNING draft_id
+        """), {'draft_id': draft_id})
+
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Draft not found or not in an endable state")
+
     try:
-        with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-            with connection.begin():
-                result = connection.execute(sqlalchemy.text("""            
-                    UPDATE drafts SET draft_status = 'ended' 
-                    WHERE draft_id = :draft_id AND draft_status = 'active'
-                    RETURNING draft_id
-                """), {'draft_id': draft_id})
-
-                if result.rowcount == 0:
-                    raise HTTPException(status_code=404, detail="Draft not found or not in an endable state")
+        await db.run_transaction("end_draft", end, isolation_level="SERIALIZABLE")
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft with Draft ID {draft_id} is busy. Please try again.", headers={"Retry-After": "1"})
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not end draft with Draft ID {draft_id}. Please try again.")
 
+    draft_state.forget(draft_id)
     return {"success": True, "message": "Draft ended successfully"}
 
 
 @router.get("/{draft_id}/picks")
-def get_draft_picks(draft_id: int):
+async def get_draft_picks(draft_id: int, since: int = Query(default=None, ge=0)):
     """
-    Returns a list of all selections made in the specified draft.
+    Returns a list of all selections made in the specified draft. With `since`, returns only the selections made after
+    that pick number together with the current pick number, so that polling clients only receive new picks.
     """
 
     try:
-        with db.engine.begin() as connection:
-            get_draft = connection.execute(sqlalchemy.text("""
+        async with db.read_transaction() as connection:
+            get_draft = (await connection.execute(sqlalchemy.text("""
                 SELECT selections.when_selected, selections.player_id, player_positions.position, teams.team_name, teams.team_id
                 FROM selections
                 JOIN teams ON selections.team_id = teams.team_id
                 JOIN player_positions ON selections.player_id = player_positions.player_id
-                WHERE teams.draft_id = :draft_id
+                WHERE selections.draft_id = :draft_id AND selections.when_selected > :since
                 ORDER BY selections.when_selected ASC;
-            """), {'draft_id': draft_id}).mappings().fetchall()
+            """), {'draft_id': draft_id, 'since': since or 0}))
+            picks = responses.records(get_draft)
             
-            if not get_draft:
+            if since is None and not picks:
                 raise HTTPException(status_code=404, detail="No picks found for the given draft ID")
-            
-            picks = [{
-                "when_selected": row['when_selected'],
-                "player_id": row['player_id'],
-                "position": row['position'],
-                "team_name": row['team_name'],
-                "team_id": row['team_id']
-            } for row in get_draft]
+
+            if picks:
+                # picks are numbered consecutively, so the newest one tells the current pick
+                last_pick = picks[-1]['when_selected']
+            elif since is not None:
+                last_pick = (await connection.execute(sqlalchemy.text("""
+                    SELECT pick_count FROM drafts
+                    WHERE draft_id = :draft_id
+                """), {'draft_id': draft_id})).scalar_one_or_none()
+
+                if last_pick is None:
+                    raise HTTPException(status_code=404, detail="Draft not found")
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not get all draft selections for draft with Draft ID {draft_id}. Please try again.")
 
-    return picks
+    if since is None:
+        return responses.JSONBytesResponse(picks)
+    return responses.JSONBytesResponse({"current_pick": last_pick + 1, "picks": picks})
 
 
 @router.get("/{draft_id}/order")
-def get_draft_order(draft_id: int):
+async def get_draft_order(draft_id: int):
     """
     Returns the order of selections for all teams in the specified draft.
     """
 
     try:
-        with db.engine.begin() as connection:
-            draft_order = connection.execute(sqlalchemy.text("""
+        async with db.async_engine.begin() as connection:
+            draft_order = (await connection.execute(sqlalchemy.text("""
                 SELECT teams.draft_position, teams.team_id, teams.team_name
                 FROM teams
                 WHERE teams.draft_id = :draft_id
                 ORDER BY draft_position ASC;
-            """), {'draft_id': draft_id}).mappings().fetchall()
-            
-            if not draft_order:
+            """), {'draft_id': draft_id}))
+            order = responses.records(draft_order)
+
+            if not order:
                 raise HTTPException(status_code=404, detail="Draft not found or draft is empty")
-            if draft_order[0]['draft_position'] is None:
+            if order[0]['draft_position'] is None:
                 raise HTTPException(status_code=404, detail="Draft order has not yet been assigned")
-
-            order = [{
-                "draft_position": row['draft_position'],
-                "team_id": row['team_id'],
-                "team_name": row['team_name']
-            } for row in draft_order]
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not get draft order for draft with Draft ID {draft_id}. Please try again.")
 
-    return order
+    return responses.JSONBytesResponse(order)
 
 
 @router.get("/{draft_id}/pick")
-def get_current_draft_pick(draft_id: int):
+async def get_current_draft_pick(draft_id: int):
     """
     Returns the team_id of the team in the given draft (via draft_id) who is currently able to draft a player.
     """
 
     try:
-        with db.engine.begin() as connection:
-            draft_status = connection.execute(sqlalchemy.text("""
-                    SELECT draft_status
-                    FROM drafts
-                    WHERE draft_id = :draft_id
-                """), {'draft_id': draft_id}).scalar_one()
+        async with db.async_engine.begin() as connection:
+            draft = (await connection.execute(sqlalchemy.text("""
+                SELECT drafts.draft_status, clock.team_id
+                FROM drafts
+                LEFT JOIN LATERAL draft_current_pick(drafts.draft_id) AS clock ON true
+                WHERE drafts.draft_id = :draft_id
+            """), {'draft_id': draft_id})).one()
             
-            if draft_status != 'active':
+            if draft.draft_status != 'active':
                     raise HTTPException(status_code=409, detail="Draft not active")
 
-            previous_picks = connection.execute(sqlalchemy.text("""
-                SELECT COUNT(*) FROM selections
-                JOIN teams ON selections.team_id = teams.team_id
-                WHERE teams.draft_id = :draft_id
-            """), {'draft_id': draft_id}).scalar_one()
-
-            number_of_teams = connection.execute(sqlalchemy.text("""
-                SELECT COUNT(*) FROM teams
-                WHERE draft_id = :draft_id
-            """), {'draft_id': draft_id}).scalar_one()
-
-            current_pick = 0
-            last_round = previous_picks // number_of_teams
-            if last_round % 2 == 1:
-                current_pick = number_of_teams - (previous_picks % number_of_teams)
-            else:
-                current_pick = (previous_picks % number_of_teams) + 1
-
-            team_id = connection.execute(sqlalchemy.text("""
-                SELECT team_id
-                FROM teams
-                WHERE draft_id = :draft_id and draft_position = :current_pick
-            """), {'draft_id': draft_id, 'current_pick': current_pick}).scalar_one()
+            team_id = draft.team_id
+            if team_id is None:
+                raise HTTPException(status_code=409, detail="Every pick in this draft has been made")
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not get current draft pick for draft with Draft ID {draft_id}. Please try again.")
 
     return {"team_id": team_id}
 
+
+# comment lines sent while a draft is quiet keep proxies from closing the stream
+KEEP_ALIVE_SECONDS = 15
+
+@router.get("/{draft_id}/events")
+async def stream_draft_events(draft_id: int):
+    """
+    Streams the picks, turn changes and status changes (start, pause, resume, end) of a draft as Server-Sent Events. The stream opens with the current status and, for an active draft, the team on the clock, and closes once the draft has ended.
+    """
+
+    # subscribe first so that nothing committed after the snapshot below is missed
+    queue = draft_events.subscribe(draft_id)
+    try:
+        async with db.async_engine.begin() as connection:
+            draft = (await connection.execute(sqlalchemy.text("""
+                SELECT drafts.draft_status, clock.team_id
+                FROM drafts
+                LEFT JOIN LATERAL draft_current_pick(drafts.draft_id) AS clock ON true
+                WHERE drafts.draft_id = :draft_id
+            """), {'draft_id': draft_id})).fetchone()
+
+        if draft is None:
+            raise HTTPException(status_code=404, detail="Draft not found")
+    except exc.SQLAlchemyError:
+        draft_events.unsubscribe(draft_id, queue)
+        raise HTTPException(status_code=400, detail=f"Could not stream events for draft with Draft ID {draft_id}. Please try again.")
+    except HTTPException:
+        draft_events.unsubscribe(draft_id, queue)
+        raise
+
+    async def stream():
+        try:
+            yield draft_events.format_event("status", {"draft_status": draft.draft_status})
+            # an ended draft has nothing more to send
+            if draft.draft_status == 'ended':
+                return
+            if draft.draft_status == 'active' and draft.team_id is not None:
+                yield draft_events.format_event("turn", {"team_id": draft.team_id})
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event is None:
+                    break
+                event, data = event
+                yield draft_events.format_event(event, data)
+                if event == "status" and data["draft_status"] == 'ended':
+                    break
+        finally:
+            draft_events.unsubscribe(draft_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
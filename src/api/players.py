@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from pydantic import BaseModel, Field
 from enum import Enum
+import base64
+import binascii
+import json
 import sqlalchemy
 from src import database as db
+from src import draft_state
+from src import player_index
+from src import stats_cache
 from src.api import auth
+from src.api import responses
 from sqlalchemy import exc
 
 router = APIRouter(
@@ -21,17 +28,16 @@ class PlayerStatisticsResponse(BaseModel):
     player_id: str
     seasons: list[dict]
 
+class PlayerStatisticsRequest(BaseModel):
+    player_ids: list[str] = Field(..., min_items=1, max_items=100)
+
+class BatchPlayerStatisticsResponse(BaseModel):
+    players: list[PlayerStatisticsResponse]
+    not_found: list[str]
+
 class DraftPlayerRequest(BaseModel):
     team_id: int
 
-class search_year_options(str, Enum):
-    all = "all"
-    y2023 = "2023"
-    y2022 = "2022"
-    y2021 = "2021"
-    y2020 = "2020"
-    y2019 = "2019"
-
 class search_position_options(str, Enum):
     all = "all"
     QB = "QB"
@@ -52,10 +58,23 @@ class search_sort_order(str, Enum):
     asc = "asc"
     desc = "desc"
 
+sort_columns = {
+    search_sort_options.player_name: "player_name",
+    search_sort_options.year: "year",
+    search_sort_options.age: "age",
+    search_sort_options.position: "position",
+    search_sort_options.team: "team",
+    search_sort_options.standard_fantasy_points: "fantasy_points_standard_10",
+    search_sort_options.ppr_fantasy_points: "fantasy_points_ppr_10"
+}
+
+# sort columns holding text; the others hold integers
+text_sort_columns = {"player_name", "position", "team"}
+
 @router.get("/search/", response_model=SearchPlayersResponse)
-def search_players(
+async def search_players(
     player_name: str = "",
-    year: search_year_options = search_year_options.all,
+    year: str = "all",
     age: str = "",
     position: search_position_options = search_position_options.all,
     team: str = "",
@@ -68,282 +87,244 @@ def search_players(
     Provides player_id, player_name, position, team, age, standard_fantasy_points, and ppr_fantasy_points for each result.
     """
 
-    if search_page == "":
-        offset = 0
-        prev_token = ""
-    else:
-        offset = (int(search_page)-1)*10
-        if offset == 0:
-            prev_token = ""
+    try:
+        index = await player_index.get()
+    except (OSError, exc.SQLAlchemyError):
+        # the index is loaded on the first search after a start or an ingest; the next attempt loads it again
+        raise HTTPException(status_code=503, detail="Player search is not available yet. Please try again.", headers={"Retry-After": "1"})
+    if year != "all" and (not year.isdigit() or int(year) not in index.years):
+        raise HTTPException(status_code=400, detail="Invalid year specified. Available years: all, " + ", ".join(str(y) for y in index.years))
+    sort_column = sort_columns[sort_col]
+    descending = sort_order is search_sort_order.desc
+
+    backwards = False
+    after = None
+    before = None
+    if search_page != "":
+        direction, cursor = decode_search_token(search_page, sort_col, sort_order)
+        backwards = direction == "previous"
+        rank = index.rank(sort_column, descending, cursor[1], cursor[2])
+        if rank is None:
+            raise HTTPException(status_code=400, detail="Invalid search page token")
+        if backwards:
+            before = rank
         else:
-            prev_token = str(int(search_page)-1)
+            after = rank
 
-    if sort_col is search_sort_options.player_name:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.player_name
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.player_name)
-    elif sort_col is search_sort_options.year:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.year
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.year)
-    elif sort_col is search_sort_options.age:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.age
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.age)
-    elif sort_col is search_sort_options.position:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.position
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.position)
-    elif sort_col is search_sort_options.team:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.team
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.team)
-    elif sort_col is search_sort_options.standard_fantasy_points:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.fantasy_points_standard_10
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.fantasy_points_standard_10)
-    elif sort_col is search_sort_options.ppr_fantasy_points:
-        if sort_order is search_sort_order.asc:
-            order_by = db.player_points.c.fantasy_points_ppr_10
-        else:
-            order_by = sqlalchemy.desc(db.player_points.c.fantasy_points_ppr_10)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid sort column specified")
-
-    stmt = (
-        sqlalchemy
-        .select(
-            db.player_points.c.player_id,
-            db.player_points.c.player_name,
-            db.player_points.c.year,
-            db.player_points.c.position,
-            db.player_points.c.team,
-            db.player_points.c.age,
-            db.player_points.c.fantasy_points_standard_10,
-            db.player_points.c.fantasy_points_ppr_10
+    try:
+        matches, more = index.search(
+            player_name=player_name,
+            year=None if year == "all" else int(year),
+            age=None if age == "" else int(age),
+            position=None if position == "all" else position.value,
+            team=team,
+            sort_col=sort_column,
+            descending=descending,
+            after=after,
+            before=before
         )
-        .select_from(db.player_points)
-        .limit(11)
-        .offset(offset)
-        .order_by(order_by)
-    )
-
-    if player_name != "":
-        stmt = stmt.where(db.player_points.c.player_name.ilike(f"%{player_name}%"))
-    if year != "all":
-        stmt = stmt.where(db.player_points.c.year == year)
-    if age != "":
-        stmt = stmt.where(db.player_points.c.age == int(age))
-    if position != "all":
-        stmt = stmt.where(db.player_points.c.position.ilike(position))
-    if team != "":
-        stmt = stmt.where(db.player_points.c.team.ilike(f"%{team}%"))
-
-    with db.engine.begin() as connection:
-        result = connection.execute(stmt).fetchall()
-        json = []
-        if len(result) > 10:
-            result = result[0:10]
-            if search_page == "":
-                next_token = "2"
-            else:
-                next_token = str(int(search_page)+1)
-        else:
-            next_token = ""
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid age specified")
+
+    result = [index.row(i) for i in matches]
+
+    prev_token = ""
+    next_token = ""
+    if result:
+        # the sort key of a row is (sort value, player_id, year)
+        first = [result[0][sort_column], result[0]["player_id"], result[0]["year"]]
+        last = [result[-1][sort_column], result[-1]["player_id"], result[-1]["year"]]
+        if (backwards and more) or (not backwards and search_page != ""):
+            prev_token = encode_search_token("previous", sort_col, sort_order, first)
+        if (not backwards and more) or backwards:
+            next_token = encode_search_token("next", sort_col, sort_order, last)
+
+    json_results = index.records(matches)
+
+    return responses.JSONBytesResponse({"previous": prev_token, "next": next_token, "results": json_results})
+
 
-        for row in result:
-            json.append(
-                {
-                    "player_id": row.player_id,
-                    "player_name": row.player_name,
-                    "year": row.year,
-                    "age": row.age,
-                    "position": row.position,
-                    "team": row.team,
-                    "standard_fantasy_points": row.fantasy_points_standard_10/10,
-                    "ppr_fantasy_points": row.fantasy_points_ppr_10/10
-                }
-            )
+def encode_search_token(direction, sort_col, sort_order, sort_key):
+    """
+    Encodes an opaque search page token holding the sort key (sort value, player_id, year) of the row to page from.
+    """
+
+    token = json.dumps([direction, sort_col.value, sort_order.value, *sort_key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
 
-        search_result = {"previous": prev_token, "next": next_token, "results": json}
 
-    return search_result
+def decode_search_token(search_page, sort_col, sort_order):
+    try:
+        token = json.loads(base64.urlsafe_b64decode(search_page + "=" * (-len(search_page) % 4)))
+        direction, token_col, token_order, *sort_key = token
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid search page token")
+
+    if direction not in ("previous", "next") or len(sort_key) != 3:
+        raise HTTPException(status_code=400, detail="Invalid search page token")
+    # the sort value must have the type of its column, the player_id must be a string and the year an integer
+    sort_value, token_player_id, token_year = sort_key
+    value_type = str if sort_columns[sort_col] in text_sort_columns else int
+    if type(sort_value) is not value_type or type(token_player_id) is not str or type(token_year) is not int:
+        raise HTTPException(status_code=400, detail="Invalid search page token")
+    if token_col != sort_col.value or token_order != sort_order.value:
+        raise HTTPException(status_code=400, detail="Search page token does not match the sort options")
+    return direction, sort_key
+
+
+@router.post("/statistics/", response_model=BatchPlayerStatisticsResponse)
+async def get_batch_player_statistics(statistics_request: PlayerStatisticsRequest):
+    """
+    Gets all player statistics for all seasons for each of the specified players (at most 100) with a single query, in the order
+    requested. Players without statistics are listed in not_found.
+    """
+
+    # keep the first occurrence of a player listed more than once
+    player_ids = list(dict.fromkeys(statistics_request.player_ids))
+
+    bodies = {}
+    for player_id in player_ids:
+        cached = stats_cache.player_statistics.get(player_id)
+        if cached is not None:
+            bodies[player_id] = cached.body
+
+    missing = [player_id for player_id in player_ids if player_id not in bodies]
+    if missing:
+        try:
+            statistics = await fetch_statistics(missing)
+        except exc.SQLAlchemyError:
+            raise HTTPException(status_code=400, detail="Could not get statistics for the specified players. Please try again.")
+        for player_id, seasons in statistics.items():
+            bodies[player_id] = stats_cache.player_statistics.put(player_id, responses.dumps({"player_id": player_id, "seasons": seasons})).body
+
+    # each player's body is the cached /players/{player_id}/ response, so it is spliced in as is
+    found = [bodies[player_id] for player_id in player_ids if player_id in bodies]
+    not_found = [player_id for player_id in player_ids if player_id not in bodies]
+    body = b'{"players":[' + b",".join(found) + b'],"not_found":' + responses.dumps(not_found) + b"}"
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/{player_id}/", response_model=PlayerStatisticsResponse)
-def get_player_statistics(player_id: str):
+async def get_player_statistics(player_id: str, if_none_match: str = Header(default="")):
     """
     Gets all player statistics for all seasons for the specified player.
     """
 
+    cached = stats_cache.player_statistics.get(player_id)
+    if cached is None:
+        seasons = await fetch_player_statistics(player_id)
+        body = responses.dumps({"player_id": player_id, "seasons": seasons})
+        cached = stats_cache.player_statistics.put(player_id, body)
+
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if if_none_match != "" and stats_cache.etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+async def fetch_player_statistics(player_id):
     try:
-        with db.engine.begin() as connection:
-            stats = connection.execute(sqlalchemy.text("""
-                SELECT player_id, year, age, position, team, games_played, games_started,
-                    passing_yards, passing_tds, interceptions, rushing_atts, rushing_yards,
-                    targets, receptions, receiving_yards, receiving_tds, fumbles, fumbles_lost,
-                    two_point_conversions, fantasy_points_standard_10, fantasy_points_ppr_10,
-                    rushing_tds, two_point_conversions_passing
-                FROM stats
-                WHERE player_id = :player_id"""), {'player_id': player_id}).mappings()
-
-        seasons = []
-        for season in stats:
-            seasons.append({
-                'year': season.year,
-                'age': season.age,
-                'position': season.position,
-                'team': season.team,
-                'games_played': season.games_played,
-                'games_started': season.games_started,
-                'passing_yards': season.passing_yards,
-                'passing_tds': season.passing_tds,
-                'interceptions': season.interceptions,
-                'rushing_atts': season.rushing_atts,
-                'rushing_yards': season.rushing_yards,
-                'rushing_tds': season.rushing_tds,
-                'targets': season.targets,
-                'receptions': season.receptions,
-                'receiving_yards': season.receiving_yards,
-                'receiving_tds': season.receiving_tds,
-                'fumbles': season.fumbles,
-                'fumbles_lost': season.fumbles_lost,
-                'two_point_conversions_passing': season.two_point_conversions_passing,
-                'two_point_conversions': season.two_point_conversions,
-                'fantasy_points_standard_10': season.fantasy_points_standard_10 / 10,
-                'fantasy_points_ppr_10': season.fantasy_points_ppr_10 / 10
-            })
-
-        if len(seasons) <= 0:
-            raise HTTPException(status_code=404, detail="Player statistics not found")
-
-        player_statistics = {"player_id": player_id, "seasons": seasons}
+        seasons = (await fetch_statistics([player_id])).get(player_id)
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not get statistics for player with Player ID {player_id}. Please try again.")
 
-    return {"player_id": player_id, "seasons": seasons}
+    if seasons is None:
+        raise HTTPException(status_code=404, detail="Player statistics not found")
+    return seasons
+
+
+async def fetch_statistics(player_ids):
+    """
+    Returns the seasons of each of the players that has statistics, by player_id, oldest season first.
+    """
+
+    async with db.read_transaction() as connection:
+        # the season columns are in the order of the response, with the fantasy points already divided
+        result = await connection.execute(sqlalchemy.text("""
+            SELECT player_id, year, age, position, team, games_played, games_started,
+                passing_yards, passing_tds, interceptions, rushing_atts, rushing_yards, rushing_tds,
+                targets, receptions, receiving_yards, receiving_tds, fumbles, fumbles_lost,
+                two_point_conversions_passing, two_point_conversions,
+                fantasy_points_standard_10 / 10::float8 AS fantasy_points_standard_10,
+                fantasy_points_ppr_10 / 10::float8 AS fantasy_points_ppr_10
+            FROM stats
+            WHERE player_id = ANY(:player_ids)
+            ORDER BY player_id, year ASC"""), {'player_ids': player_ids})
+
+    columns = tuple(result.keys())[1:]
+    statistics = {}
+    for row in result:
+        statistics.setdefault(row[0], []).append(dict(zip(columns, row[1:])))
+    return statistics
 
 
 @router.post("/{player_id}/draft")
-def draft_player(player_id: str, request: DraftPlayerRequest):
+async def draft_player(player_id: str, request: DraftPlayerRequest):
     """
     Drafts a player to a team. The player must be available, it must be the team's pick, and the player pick must not violate minimum and maximum position restraints for a roster.
     """
 
+    async def draft(connection):
+        player_position = await draft_state.player_position(connection, player_id)
+
+        try:
+            state = await draft_state.get(connection, draft_id)
+            try:
+                check_pick(state, request.team_id, player_id, player_position)
+            except draft_state.PickRejected as rejection:
+                if not rejection.stale:
+                    raise
+                state = await draft_state.load(connection, draft_id)
+                check_pick(state, request.team_id, player_id, player_position)
+
+            # draft_pick locks the draft, repeats every check against the database and inserts the selection.
+            # The first row is this pick; any further rows are picks made from the queues of the teams after it.
+            picks = (await connection.execute(sqlalchemy.text("""
+                SELECT status_code, detail, team_id, player_id, when_selected
+                FROM draft_pick_with_queues(:team_id, :player_id)
+            """), {'team_id': request.team_id, 'player_id': player_id})).fetchall()
+        except exc.SQLAlchemyError:
+            draft_state.discard(draft_id)
+            raise
+
+        if picks[0].status_code != 200:
+            draft_state.discard(draft_id)
+            raise HTTPException(status_code=picks[0].status_code, detail=picks[0].detail)
+
+        return [(pick.team_id, pick.player_id, await draft_state.player_position(connection, pick.player_id), pick.when_selected)
+                for pick in picks]
+
     try:
-        with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-            with connection.begin():
-                draft_info = connection.execute(sqlalchemy.text("""
-                    SELECT teams.draft_id, drafts.draft_status, teams.draft_position, drafts.roster_size FROM teams
-                    JOIN drafts ON teams.draft_id = drafts.draft_id
-                    WHERE teams.team_id = :team_id FOR UPDATE
-                """), {'team_id': request.team_id}).mappings().fetchone()
-
-                if not draft_info:
-                    raise HTTPException(status_code=404, detail="Team not found")
-
-                if draft_info['draft_status'] != 'active':
-                    raise HTTPException(status_code=409, detail="Draft not active")
-                
-                try:
-                    player_position = connection.execute(sqlalchemy.text("""
-                        SELECT position 
-                        FROM player_positions 
-                        WHERE player_id = :player_id
-                    """), {'player_id': player_id}).scalar_one()
-                except:
-                    raise HTTPException(status_code=404, detail="Player not found")
-
-                already_drafted = connection.execute(sqlalchemy.text("""
-                    SELECT EXISTS (
-                        SELECT 1 FROM selections
-                        JOIN teams ON selections.team_id = teams.team_id
-                        WHERE teams.draft_id = :draft_id AND selections.player_id = :player_id
-                    )
-                """), {'draft_id': draft_info['draft_id'], 'player_id': player_id}).scalar_one()
-
-                if already_drafted:
-                    raise HTTPException(status_code=409, detail="Player already drafted in this draft")
-
-                previous_picks = connection.execute(sqlalchemy.text("""
-                    SELECT COUNT(*) FROM selections
-                    JOIN teams ON selections.team_id = teams.team_id
-                    WHERE teams.draft_id = :draft_id
-                """), {'draft_id': draft_info['draft_id']}).scalar_one()
-
-                number_of_teams = connection.execute(sqlalchemy.text("""
-                    SELECT COUNT(*) FROM teams
-                    WHERE draft_id = :draft_id
-                """), {'draft_id': draft_info['draft_id']}).scalar_one()
-
-                last_round = previous_picks // number_of_teams
-                if last_round % 2 == 1:
-                    current_pick = number_of_teams - (previous_picks % number_of_teams)
-                else:
-                    current_pick = (previous_picks % number_of_teams) + 1
-
-                if current_pick != draft_info['draft_position']:
-                    raise HTTPException(status_code=403, detail="Not your turn to draft")
-                
-                total_selections = connection.execute(sqlalchemy.text("""
-                    SELECT COUNT(*) FROM selections
-                    WHERE team_id = :team_id
-                """), {'team_id': request.team_id}).scalar_one()
-                remaining_picks = draft_info['roster_size'] - total_selections
-
-                if remaining_picks <= 0:
-                    raise HTTPException(status_code=409, detail="No remaining picks for this team")
-
-                res = connection.execute(sqlalchemy.text("""
-                    WITH counter AS (
-                        SELECT player_positions.position, COUNT(*) as num_selected
-                        FROM selections
-                        JOIN player_positions ON selections.player_id = player_positions.player_id
-                        WHERE selections.team_id = :team_id
-                        GROUP BY player_positions.position
-                    )
-                    SELECT position_requirements.position, position_requirements.min, COALESCE(counter.num_selected, 0) as num_selected
-                    FROM position_requirements
-                    LEFT JOIN counter ON position_requirements.position = counter.position
-                    WHERE draft_id = :draft_id
-                """), {'team_id': request.team_id, 'draft_id': draft_info['draft_id']})
-
-                positions_needed = {}
-                total_needed_picks = 0
-                for position in res:
-                    needed = max(0, position.min - position.num_selected)
-                    positions_needed[position.position] = needed
-                    total_needed_picks += needed
-
-                current_count = connection.execute(sqlalchemy.text("""
-                    SELECT COUNT(*) 
-                    FROM selections
-                    JOIN player_positions ON selections.player_id = player_positions.player_id
-                    WHERE selections.team_id = :team_id AND player_positions.position = :position
-                """), {'team_id': request.team_id, 'position': player_position}).scalar_one()
-
-                max_allowed = connection.execute(sqlalchemy.text("""
-                    SELECT max FROM position_requirements
-                    WHERE draft_id = :draft_id AND position = :position
-                """), {'draft_id': draft_info['draft_id'], 'position': player_position}).scalar_one()
-
-                if total_needed_picks >= remaining_picks and positions_needed[player_position] < 1:
-                    raise HTTPException(status_code=409, detail="Cannot draft player; minimum positions not met. Current requirements:" + str(positions_needed))
-                elif current_count >= max_allowed:
-                    raise HTTPException(status_code=409, detail=f"Maximum number of {player_position} players reached")
-                
-                connection.execute(sqlalchemy.text("""
-                    INSERT INTO selections (team_id, player_id, when_selected)
-                    VALUES (:team_id, :player_id, :when_selected)
-                """), {'team_id': request.team_id, 'player_id': player_id, 'when_selected': previous_picks + 1})
+        draft_id = draft_state.cached_draft_for_team(request.team_id)
+        if draft_id is None:
+            async with db.async_engine.connect() as connection:
+                draft_id = await draft_state.draft_for_team(connection, request.team_id)
+        if draft_id is None:
+            raise HTTPException(status_code=404, detail="Team not found")
+
+        # picks in a draft wait for each other here rather than in the database, so a waiting request does
+        # not hold a pooled connection idle in transaction
+        async with draft_state.lock(draft_id):
+            new_picks = await db.run_transaction("draft_player", draft)
+            # only picks that were committed may reach the cached state; a failed or retried commit leaves it untouched
+            draft_state.record_picks(draft_id, new_picks)
+    except draft_state.PickRejected as rejection:
+        raise HTTPException(status_code=rejection.status_code, detail=rejection.detail)
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft for Team ID {request.team_id} is busy. Please try again.", headers={"Retry-After": "1"})
     except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail=f"Could not draft player with Player ID {player_id}. Please try again.")
 
-    return {"success": True, "message": "Player drafted successfully"}
+    return {
+        "success": True,
+        "message": "Player drafted successfully",
+        "queued_picks": [{"team_id": team_id, "player_id": queued_player_id, "selection": selection}
+                         for team_id, queued_player_id, _, selection in new_picks[1:]]
+    }
+
+
+def check_pick(state, team_id, player_id, player_position):
+    if state.draft_status == 'active' and player_position is None:
+        raise HTTPException(status_code=404, detail="Player not found")
+    state.check_pick(team_id, player_id, player_position)
 
@@ -0,0 +1,33 @@
+import orjson
+from fastapi.responses import Response
+
+# When an endpoint returns a dict or list, FastAPI validates it against the
+# response_model, walks it with jsonable_encoder and then encodes it with the
+# json module, which costs far more than the query on the list endpoints.
+# Returning a JSONBytesResponse skips all of that; the response_model is still
+# used for the documentation. benchmarks/serialization.py measures the saving.
+
+
+class JSONBytesResponse(Response):
+    """
+    JSON response encoded with orjson. The content must already be made of JSON types.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def dumps(content):
+    return orjson.dumps(content)
+
+
+def records(result):
+    """
+    Returns the rows of a result as a list of dicts keyed by column name, in SELECT order. Zipping the row tuples
+    is much cheaper than going through RowMapping or building each dict by hand.
+    """
+
+    columns = tuple(result.keys())
+    return [dict(zip(columns, row)) for row in result]
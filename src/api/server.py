@@ -1,7 +1,13 @@
 from fastapi import FastAPI, exceptions
 from fastapi.responses import JSONResponse, Response
 from pydantic import ValidationError
+from sqlalchemy import exc
 from src.api import drafts, players, teams
+from src import database as db
+from src import player_index
+from src import draft_events
+from src import metrics
+import asyncio
 import json
 import logging
 
@@ -14,10 +20,39 @@ app = FastAPI(
     description=description
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(teams.router)
 app.include_router(drafts.router)
 app.include_router(players.router)
 
+# workers start serving without the database; /ready reports once the warm-up below has finished
+WARM_UP_RETRY_DELAY = 1
+warm_up_task = None
+
+async def warm_up():
+    while True:
+        try:
+            await db.warm_up()
+            await player_index.load()
+            return
+        except (OSError, exc.SQLAlchemyError):
+            logging.warning("Database warm-up failed; retrying")
+            await asyncio.sleep(WARM_UP_RETRY_DELAY)
+
+@app.on_event("startup")
+async def start_warm_up():
+    global warm_up_task
+    warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("startup")
+async def listen_for_draft_events():
+    draft_events.start()
+
+@app.on_event("shutdown")
+async def stop_listening_for_draft_events():
+    await draft_events.stop()
+
 @app.exception_handler(exceptions.RequestValidationError)
 @app.exception_handler(ValidationError)
 async def validation_exception_handler(request, exc):
@@ -33,6 +68,29 @@ async def validation_exception_handler(request, exc):
 async def root():
     return {"message": "Welcome to MockMaster."}
 
+@app.get("/ready")
+async def ready():
+    """
+    Returns 200 once the worker has connected to the database and loaded the player index, and 503 until then.
+    """
+    if warm_up_task is None or not warm_up_task.done():
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
+@app.get("/transactions")
+async def transaction_counters():
+    """
+    Returns the transaction attempts, retryable aborts and exhausted retries recorded for each endpoint.
+    """
+    return db.transaction_counters
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Returns request, query and transaction metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(db.transaction_counters), media_type="text/plain; version=0.0.4")
+
 @app.get("/favicon.ico")
 async def favicon():
     return Response(status_code=204)
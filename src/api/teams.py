@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from src import database as db
+from src import draft_state
 import sqlalchemy
 from src.api import auth
 from pydantic import BaseModel, Field
@@ -15,15 +16,18 @@ router = APIRouter(
 class TeamUpdateRequest(BaseModel):
     team_name: str = Field(..., min_length=3, max_length=14)
 
+class PickQueueRequest(BaseModel):
+    player_ids: list[str] = Field(..., max_items=100)
+
 @router.put("/{team_id}/")
-def update_team_name(team_id: int, update_request: TeamUpdateRequest):
+async def update_team_name(team_id: int, update_request: TeamUpdateRequest):
     """
     Updates the name of a team based on the team_id.
     """
 
     try:
-        with db.engine.begin() as connection:
-            update_team = connection.execute(sqlalchemy.text("""
+        async with db.async_engine.begin() as connection:
+            update_team = await connection.execute(sqlalchemy.text("""
                 UPDATE teams SET team_name = :team_name WHERE team_id = :team_id
             """), {"team_name": update_request.team_name, "team_id": team_id})
         
@@ -36,14 +40,14 @@ def update_team_name(team_id: int, update_request: TeamUpdateRequest):
 
 
 @router.get("/{team_id}")
-def get_team(team_id: int):
+async def get_team(team_id: int):
     """
     Retrieves detailed information about a team's selections, including the draft positions, player positions, and names of players selected.
     """
 
     try:
-        with db.engine.begin() as connection:
-            team_info = connection.execute(sqlalchemy.text("""
+        async with db.read_transaction() as connection:
+            team_info = await connection.execute(sqlalchemy.text("""
                 SELECT when_selected, position, player_name 
                 FROM selections
                 JOIN player_positions on selections.player_id = player_positions.player_id
@@ -59,3 +63,74 @@ def get_team(team_id: int):
         
     return team
 
+
+@router.put("/{team_id}/queue")
+async def set_pick_queue(team_id: int, queue_request: PickQueueRequest):
+    """
+    Replaces a team's pick queue with a ranked list of players. Whenever it becomes the team's turn, the first player in the queue that is still available and fits the roster's position restraints is drafted automatically, and the next team's queue is checked in turn.
+    """
+
+    # keep the first occurrence of a player listed more than once
+    player_ids = list(dict.fromkeys(queue_request.player_ids))
+
+    async def set_queue(connection):
+        draft_id = await draft_state.draft_for_team(connection, team_id)
+        if draft_id is None:
+            raise HTTPException(status_code=404, detail="Team not found")
+
+        await connection.execute(sqlalchemy.text("""
+            DELETE FROM pick_queues WHERE team_id = :team_id
+        """), {"team_id": team_id})
+
+        if player_ids:
+            await connection.execute(sqlalchemy.text("""
+                INSERT INTO pick_queues (team_id, player_id, rank)
+                VALUES (:team_id, :player_id, :rank)
+            """), [{"team_id": team_id, "player_id": player_id, "rank": rank} for rank, player_id in enumerate(player_ids, start=1)])
+
+        # the team may already be on the clock
+        queued_picks = (await connection.execute(sqlalchemy.text("""
+            SELECT team_id, player_id, when_selected FROM draft_queued_picks(:draft_id)
+        """), {"draft_id": draft_id})).fetchall()
+
+        if queued_picks:
+            draft_state.discard(draft_id)
+        return queued_picks
+
+    try:
+        queued_picks = await db.run_transaction("set_pick_queue", set_queue)
+    except db.TransactionAborted:
+        raise HTTPException(status_code=503, detail=f"Draft for Team ID {team_id} is busy. Please try again.", headers={"Retry-After": "1"})
+    except exc.SQLAlchemyError:
+        raise HTTPException(status_code=400, detail=f"Could not set pick queue for team with Team ID {team_id}. Please try again.")
+
+    return {
+        "success": True,
+        "message": "Pick queue updated successfully",
+        "queued_picks": [{"team_id": pick.team_id, "player_id": pick.player_id, "selection": pick.when_selected} for pick in queued_picks]
+    }
+
+
+@router.get("/{team_id}/queue")
+async def get_pick_queue(team_id: int):
+    """
+    Retrieves a team's pick queue in the order its players will be drafted.
+    """
+
+    try:
+        async with db.async_engine.begin() as connection:
+            queue = await connection.execute(sqlalchemy.text("""
+                SELECT pick_queues.player_id, player_name, position
+                FROM pick_queues
+                JOIN player_positions ON pick_queues.player_id = player_positions.player_id
+                WHERE pick_queues.team_id = :team_id
+                ORDER BY rank ASC
+            """), {"team_id": team_id})
+
+        players = []
+        for row in queue:
+            players.append({"player_id": row.player_id, "player": row.player_name, "position": row.position})
+    except exc.SQLAlchemyError:
+        raise HTTPException(status_code=400, detail=f"Could not get pick queue for team with Team ID {team_id}. Please try again.")
+
+    return players
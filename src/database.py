@@ -1,17 +1,194 @@
+import asyncio
+import contextlib
+import logging
 import os
+import random
+import time
 import dotenv
 import sqlalchemy
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from src import metrics
 
 # create connection url
 def database_connection_url():
     dotenv.load_dotenv()
     return os.environ.get("POSTGRES_URI")
 
-# create engine
-engine = create_engine(database_connection_url(), pool_pre_ping=True)
+# the routers run on asyncpg so a request waiting on Postgres does not hold a threadpool worker
+def async_database_connection_url(url=None):
+    return sqlalchemy.engine.make_url(url or database_connection_url()).set(drivername="postgresql+asyncpg")
+
+# read-only endpoints can use a replica; without one they read from the primary
+def replica_connection_url():
+    dotenv.load_dotenv()
+    return os.environ.get("POSTGRES_REPLICA_URI") or None
+
+# pool sizes and timeouts of the API engines, set with DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds),
+# DB_POOL_RECYCLE (seconds, -1 to keep connections forever), DB_CONNECT_TIMEOUT (seconds) and
+# DB_STATEMENT_TIMEOUT (milliseconds, 0 for none)
+def pool_settings():
+    dotenv.load_dotenv()
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", -1)),
+        "connect_args": {
+            "timeout": float(os.environ.get("DB_CONNECT_TIMEOUT", 10)),
+            "server_settings": {"statement_timeout": os.environ.get("DB_STATEMENT_TIMEOUT", "0")}
+        }
+    }
+
+def create_api_engine(url, name):
+    api_engine = create_async_engine(async_database_connection_url(url), pool_pre_ping=True, poolclass=metrics.TimedAsyncQueuePool,
+                                     pool_logging_name=name, **pool_settings())
+    metrics.instrument(api_engine.sync_engine)
+    metrics.register_pool(api_engine.sync_engine)
+    return api_engine
+
+# create engines; the sync engine serves scripts and maintenance jobs, which keep the default pool and no statement timeout
+engine = create_engine(database_connection_url(), pool_pre_ping=True, poolclass=metrics.TimedQueuePool, pool_logging_name="sync")
+metrics.instrument(engine)
+async_engine = create_api_engine(database_connection_url(), "primary")
+read_engine = async_engine if replica_connection_url() is None else create_api_engine(replica_connection_url(), "replica")
 
 # create object metadata
 metadata_obj = sqlalchemy.MetaData()
 
-player_points = sqlalchemy.Table("player_points", metadata_obj, autoload_with=engine)
+# declared rather than reflected, so importing this module never waits on the database
+player_points = sqlalchemy.Table(
+    "player_points",
+    metadata_obj,
+    sqlalchemy.Column("player_id", sqlalchemy.Text),
+    sqlalchemy.Column("player_name", sqlalchemy.Text),
+    sqlalchemy.Column("year", sqlalchemy.Integer),
+    sqlalchemy.Column("position", sqlalchemy.Text),
+    sqlalchemy.Column("team", sqlalchemy.Text),
+    sqlalchemy.Column("age", sqlalchemy.Integer),
+    sqlalchemy.Column("fantasy_points_standard_10", sqlalchemy.Integer),
+    sqlalchemy.Column("fantasy_points_ppr_10", sqlalchemy.Integer)
+)
+
+# after failing to reach the replica, reads go to the primary for this many seconds before it is tried again
+REPLICA_RETRY_DELAY = 5
+# how long wait_for_replica waits for the replica to catch up
+REPLICA_CATCH_UP_TIMEOUT = 30
+_replica_retry_at = 0
+
+
+@contextlib.asynccontextmanager
+async def read_transaction():
+    """
+    Begins a transaction for a read-only endpoint on the replica. Falls back to the primary when there is no replica
+    or it cannot be reached. A replica can lag slightly behind the primary, so only reads that tolerate that use it.
+    """
+
+    global _replica_retry_at
+    if read_engine is async_engine or time.monotonic() < _replica_retry_at:
+        connection = await async_engine.connect()
+    else:
+        try:
+            connection = await read_engine.connect()
+        except (OSError, exc.DBAPIError):
+            logging.warning(f"Replica not reachable; reading from the primary for {REPLICA_RETRY_DELAY}s")
+            _replica_retry_at = time.monotonic() + REPLICA_RETRY_DELAY
+            connection = await async_engine.connect()
+
+    try:
+        async with connection.begin():
+            yield connection
+    finally:
+        await connection.close()
+
+
+async def wait_for_replica(timeout=REPLICA_CATCH_UP_TIMEOUT):
+    """
+    Waits until the replica has replayed everything committed on the primary so far, so that data reloaded after a
+    change is not read from before it. Gives up after timeout seconds, or at once if the replica cannot be reached.
+    """
+
+    if read_engine is async_engine:
+        return
+
+    async with async_engine.connect() as connection:
+        lsn = (await connection.execute(sqlalchemy.text("SELECT pg_current_wal_lsn()"))).scalar_one()
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with read_engine.connect() as connection:
+                # pg_last_wal_replay_lsn() is null on a server that is not replaying WAL
+                caught_up = (await connection.execute(sqlalchemy.text("""
+                    SELECT COALESCE(pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn), true)
+                """), {"lsn": lsn})).scalar_one()
+        except (OSError, exc.DBAPIError):
+            return
+        if caught_up:
+            return
+        await asyncio.sleep(0.1)
+    logging.warning(f"Replica still behind the primary after {timeout}s")
+
+
+async def warm_up():
+    """
+    Opens the pools' connections ahead of the first requests.
+    """
+
+    async def connect(begin):
+        async with begin() as connection:
+            await connection.execute(sqlalchemy.text("SELECT 1"))
+
+    transactions = [async_engine.begin] * async_engine.pool.size()
+    if read_engine is not async_engine:
+        # an unreachable replica does not hold up the warm-up, since reads fall back to the primary
+        transactions += [read_transaction] * read_engine.pool.size()
+    await asyncio.gather(*(connect(begin) for begin in transactions))
+
+# serialization failures and deadlocks roll the whole transaction back, so it is safe to run it again
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+# per-endpoint transaction attempts, aborts (retryable failures) and transactions that ran out of retries
+transaction_counters = {}
+
+
+class TransactionAborted(Exception):
+    """
+    Raised when a transaction still fails with a serialization failure or deadlock after every retry.
+    """
+
+
+def count_transaction(name, counter):
+    counters = transaction_counters.setdefault(name, {"attempts": 0, "aborts": 0, "exhausted": 0})
+    counters[counter] += 1
+
+
+def is_retryable(error):
+    sqlstate = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    return sqlstate in RETRYABLE_SQLSTATES
+
+
+async def run_transaction(name, work, isolation_level=None, max_attempts=5, base_delay=0.01, max_delay=0.5):
+    """
+    Awaits work(connection) inside a transaction and returns its result. Serialization failures and deadlocks
+    are retried with jittered exponential backoff; any other error is raised to the caller unchanged.
+    """
+
+    for attempt in range(max_attempts):
+        count_transaction(name, "attempts")
+        try:
+            async with async_engine.connect() as connection:
+                if isolation_level is not None:
+                    await connection.execution_options(isolation_level=isolation_level)
+                async with connection.begin():
+                    return await work(connection)
+        except exc.DBAPIError as error:
+            if not is_retryable(error):
+                raise
+            count_transaction(name, "aborts")
+
+        if attempt + 1 < max_attempts:
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+    count_transaction(name, "exhausted")
+    raise TransactionAborted(name)
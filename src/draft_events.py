@@ -0,0 +1,118 @@
+import asyncio
+import json
+import asyncpg
+import sqlalchemy
+from src import database as db
+from src import draft_state
+from src import player_data
+
+# Each worker holds one LISTEN connection on the draft_events channel and fans
+# every notification out to the event streams of its own subscribers. draft_pick
+# and the drafts status trigger publish on commit, so every worker sees every pick.
+# The same connection listens for new player data (see player_data).
+
+CHANNEL = "draft_events"
+RECONNECT_DELAY = 1
+
+_subscribers = {}
+_listener = None
+
+
+def subscribe(draft_id, maxsize=100):
+    queue = asyncio.Queue(maxsize=maxsize)
+    _subscribers.setdefault(draft_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(draft_id, queue):
+    queues = _subscribers.get(draft_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[draft_id]
+
+
+def events(notification):
+    """
+    Turns a draft_events notification into the (event, data) pairs sent to subscribers.
+    """
+
+    if notification["event"] == "pick":
+        yield "pick", {key: notification[key] for key in ("team_id", "player_id", "position", "selection")}
+    else:
+        yield "status", {"draft_status": notification["draft_status"]}
+
+    if notification["next_team_id"] is not None:
+        yield "turn", {"team_id": notification["next_team_id"]}
+
+
+def publish(draft_id, event, data):
+    for queue in list(_subscribers.get(draft_id, ())):
+        try:
+            queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # a subscriber this far behind is dropped; it reconnects and catches up from the picks endpoint
+            unsubscribe(draft_id, queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+def _dispatch(connection, pid, channel, payload):
+    notification = json.loads(payload)
+    draft_id = notification["draft_id"]
+
+    if notification["event"] == "pick":
+        draft_state.observe_pick(draft_id, notification["selection"])
+    elif notification["draft_status"] == "ended":
+        draft_state.forget(draft_id)
+    else:
+        draft_state.discard(draft_id)
+
+    for event, data in events(notification):
+        publish(draft_id, event, data)
+
+
+async def _listen():
+    dsn = sqlalchemy.engine.make_url(db.database_connection_url()).set(drivername="postgresql")
+    reconnecting = False
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn.render_as_string(hide_password=False))
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(CHANNEL, _dispatch)
+            await connection.add_listener(player_data.CHANNEL, player_data.dispatch)
+            if reconnecting:
+                # a season may have been ingested while the connection was down
+                player_data.reload_soon()
+            reconnecting = True
+            await closed.wait()
+        except (OSError, asyncpg.PostgresError):
+            pass
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+def start():
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+async def stop():
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
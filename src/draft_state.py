@@ -0,0 +1,235 @@
+import asyncio
+import weakref
+import sqlalchemy
+from src import lru_cache
+
+# In-memory state for active drafts so that draft_player can validate a pick
+# without re-counting selections on every request. The database stays the
+# source of truth: state is rebuilt from teams/selections whenever it is
+# missing (e.g. after a restart) or found to be stale.
+
+class PickRejected(Exception):
+    """
+    Raised when a pick fails validation. `stale` marks rejections that another worker could have made
+    outdated (draft status, turn order), so the caller should reload the state before trusting them.
+    """
+
+    def __init__(self, status_code, detail, stale=False):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.stale = stale
+
+
+class DraftState:
+    """
+    Pick count, pick schedule, per-team position counts and position limits for a single draft.
+    """
+
+    def __init__(self, draft_id, draft_status, roster_size, schedule, requirements, selections):
+        self.draft_id = draft_id
+        self.draft_status = draft_status
+        self.roster_size = roster_size
+        # team_id of every pick in pick order
+        self.schedule = schedule
+        # position -> (min, max)
+        self.requirements = requirements
+        self.pick_count = 0
+        self.drafted = set()
+        self.team_picks = {team_id: 0 for team_id in schedule}
+        self.position_counts = {team_id: {} for team_id in schedule}
+
+        for team_id, player_id, position in selections:
+            self.record_pick(team_id, player_id, position)
+
+    def current_team(self):
+        if self.pick_count < len(self.schedule):
+            return self.schedule[self.pick_count]
+        return None
+
+    def check_pick(self, team_id, player_id, position):
+        if self.draft_status != 'active':
+            raise PickRejected(409, "Draft not active", stale=True)
+
+        if player_id in self.drafted:
+            raise PickRejected(409, "Player already drafted in this draft")
+
+        # once the schedule is exhausted every roster is full, which the remaining picks check reports
+        current_team = self.current_team()
+        if current_team is not None and current_team != team_id:
+            raise PickRejected(403, "Not your turn to draft", stale=True)
+
+        remaining_picks = self.roster_size - self.team_picks[team_id]
+        if remaining_picks <= 0:
+            raise PickRejected(409, "No remaining picks for this team")
+
+        counts = self.position_counts[team_id]
+        positions_needed = {}
+        total_needed_picks = 0
+        for requirement, (min_allowed, _) in self.requirements.items():
+            needed = max(0, min_allowed - counts.get(requirement, 0))
+            positions_needed[requirement] = needed
+            total_needed_picks += needed
+
+        if total_needed_picks >= remaining_picks and positions_needed.get(position, 0) < 1:
+            raise PickRejected(409, "Cannot draft player; minimum positions not met. Current requirements:" + str(positions_needed))
+        elif counts.get(position, 0) >= self.requirements[position][1]:
+            raise PickRejected(409, f"Maximum number of {position} players reached")
+
+    def record_pick(self, team_id, player_id, position):
+        self.pick_count += 1
+        self.drafted.add(player_id)
+        self.team_picks[team_id] += 1
+        counts = self.position_counts[team_id]
+        counts[position] = counts.get(position, 0) + 1
+
+
+# drafts and teams that are no longer picking fall out of the caches instead of piling up in a long-running worker
+_states = lru_cache.LRUCache(maxsize=1024)
+_team_drafts = lru_cache.LRUCache(maxsize=16384)
+_player_positions = None
+# picks in the same draft are serialized per process. Each draft has its own lock, so unrelated drafts never wait
+# on each other; a lock disappears once no request holds or waits on it.
+_draft_locks = weakref.WeakValueDictionary()
+
+
+def lock(draft_id):
+    draft_lock = _draft_locks.get(draft_id)
+    if draft_lock is None:
+        draft_lock = _draft_locks[draft_id] = asyncio.Lock()
+    return draft_lock
+
+
+async def player_position(connection, player_id):
+    """
+    Returns the position of a player, or None if the player does not exist. player_positions only changes when a
+    season is ingested, so it is loaded once and reloaded after each ingest.
+    """
+
+    global _player_positions
+    if _player_positions is None:
+        rows = await connection.execute(sqlalchemy.text("""
+            SELECT player_id, position FROM player_positions
+        """))
+        _player_positions = {row.player_id: row.position for row in rows}
+    return _player_positions.get(player_id)
+
+
+def cached_draft_for_team(team_id):
+    """
+    Returns the draft_id a team belongs to if it is cached, otherwise None.
+    """
+
+    return _team_drafts.get(team_id)
+
+
+async def draft_for_team(connection, team_id):
+    """
+    Returns the draft_id a team belongs to, or None if the team does not exist.
+    """
+
+    draft_id = cached_draft_for_team(team_id)
+    if draft_id is None:
+        result = await connection.execute(sqlalchemy.text("""
+            SELECT draft_id FROM teams WHERE team_id = :team_id
+        """), {'team_id': team_id})
+        draft_id = result.scalar_one_or_none()
+        if draft_id is not None:
+            _team_drafts.put(team_id, draft_id)
+    return draft_id
+
+
+async def get(connection, draft_id):
+    state = _states.get(draft_id)
+    if state is None:
+        state = await load(connection, draft_id)
+    return state
+
+
+async def load(connection, draft_id):
+    """
+    Rebuilds the state of a draft from the drafts, pick_schedule, position_requirements and selections tables.
+    """
+
+    draft = (await connection.execute(sqlalchemy.text("""
+        SELECT draft_status, roster_size FROM drafts
+        WHERE draft_id = :draft_id
+    """), {'draft_id': draft_id})).one()
+
+    schedule = (await connection.execute(sqlalchemy.text("""
+        SELECT team_id FROM pick_schedule
+        WHERE draft_id = :draft_id
+        ORDER BY pick_number ASC
+    """), {'draft_id': draft_id})).scalars().all()
+
+    position_requirements = await connection.execute(sqlalchemy.text("""
+        SELECT position, min, max FROM position_requirements
+        WHERE draft_id = :draft_id
+    """), {'draft_id': draft_id})
+    requirements = {row.position: (row.min, row.max) for row in position_requirements}
+
+    selections = (await connection.execute(sqlalchemy.text("""
+        SELECT selections.team_id, selections.player_id, player_positions.position
+        FROM selections
+        JOIN player_positions ON selections.player_id = player_positions.player_id
+        WHERE selections.draft_id = :draft_id
+        ORDER BY selections.when_selected ASC
+    """), {'draft_id': draft_id})).fetchall()
+
+    state = DraftState(draft_id, draft.draft_status, draft.roster_size, schedule, requirements, selections)
+    _states.put(draft_id, state)
+    return state
+
+
+def forget_player_positions():
+    """
+    Drops the cached player positions, and every draft state counted with them, after player_positions is refreshed.
+    """
+
+    global _player_positions
+    _player_positions = None
+    _states.clear()
+
+
+def discard(draft_id):
+    """
+    Drops the cached state of a draft so the next pick rebuilds it from the database.
+    """
+
+    _states.pop(draft_id)
+
+
+def forget(draft_id):
+    """
+    Drops everything cached about a draft that has ended, including which draft its teams belong to.
+    """
+
+    _states.pop(draft_id)
+    for team_id in [team_id for team_id, team_draft_id in _team_drafts.entries.items() if team_draft_id == draft_id]:
+        _team_drafts.pop(team_id)
+
+
+def record_picks(draft_id, picks):
+    """
+    Applies committed picks, as (team_id, player_id, position, selection), to the cached state of a draft. The state
+    is dropped instead if the picks do not directly follow the ones it has counted.
+    """
+
+    state = _states.get(draft_id)
+    if state is None:
+        return
+    for team_id, player_id, position, selection in picks:
+        if selection != state.pick_count + 1:
+            discard(draft_id)
+            return
+        state.record_pick(team_id, player_id, position)
+
+
+def observe_pick(draft_id, selection):
+    """
+    Drops the cached state of a draft when a pick made elsewhere shows that it has fallen behind.
+    """
+
+    state = _states.get(draft_id)
+    if state is not None and state.pick_count < selection:
+        _states.pop(draft_id)
@@ -0,0 +1,32 @@
+import collections
+
+# The bounded caches a long-running worker keeps in memory (cached draft state,
+# team drafts, player statistics responses) all evict the same way.
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry once it holds more than maxsize entries.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
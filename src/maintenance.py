@@ -0,0 +1,114 @@
+import argparse
+import sys
+import sqlalchemy
+from sqlalchemy import exc
+from src import database as db
+
+# Maintenance jobs for the denormalized draft counters. team_count and pick_count
+# are kept up to date by join_draft_room and draft_pick; data loaded straight
+# into teams/selections (e.g. the fake data) needs a backfill afterwards.
+#
+#   python -m src.maintenance backfill-counters
+#   python -m src.maintenance check-counters
+
+BACKFILL_BATCH_SIZE = 1000
+MAX_ATTEMPTS = 5
+
+
+def counter_mismatches(connection):
+    """
+    Returns the drafts whose team_count or pick_count differs from their teams and selections.
+    """
+
+    return connection.execute(sqlalchemy.text("""
+        SELECT drafts.draft_id, drafts.team_count, drafts.pick_count,
+            COALESCE(team_counts.team_count, 0) AS actual_team_count,
+            COALESCE(pick_counts.pick_count, 0) AS actual_pick_count
+        FROM drafts
+        LEFT JOIN (
+            SELECT draft_id, COUNT(*) AS team_count
+            FROM teams
+            GROUP BY draft_id
+        ) AS team_counts ON drafts.draft_id = team_counts.draft_id
+        LEFT JOIN (
+            SELECT draft_id, COUNT(*) AS pick_count
+            FROM selections
+            GROUP BY draft_id
+        ) AS pick_counts ON drafts.draft_id = pick_counts.draft_id
+        WHERE drafts.team_count <> COALESCE(team_counts.team_count, 0)
+            OR drafts.pick_count <> COALESCE(pick_counts.pick_count, 0)
+        ORDER BY drafts.draft_id
+    """)).fetchall()
+
+
+def backfill_batch(first_draft_id, last_draft_id):
+    """
+    Recomputes the counters of the drafts in [first_draft_id, last_draft_id]. Runs serializable so that a join
+    or pick committed while the batch is counting makes the batch retry instead of writing a stale count.
+    """
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
+                with connection.begin():
+                    return connection.execute(sqlalchemy.text("""
+                        UPDATE drafts
+                        SET team_count = counts.team_count, pick_count = counts.pick_count
+                        FROM (
+                            SELECT drafts.draft_id,
+                                (SELECT COUNT(*) FROM teams WHERE teams.draft_id = drafts.draft_id) AS team_count,
+                                (SELECT COUNT(*) FROM selections WHERE selections.draft_id = drafts.draft_id) AS pick_count
+                            FROM drafts
+                            WHERE drafts.draft_id BETWEEN :first_draft_id AND :last_draft_id
+                        ) AS counts
+                        WHERE drafts.draft_id = counts.draft_id
+                            AND (drafts.team_count, drafts.pick_count) IS DISTINCT FROM (counts.team_count, counts.pick_count)
+                    """), {"first_draft_id": first_draft_id, "last_draft_id": last_draft_id}).rowcount
+        except exc.DBAPIError as error:
+            if not db.is_retryable(error) or attempt + 1 == MAX_ATTEMPTS:
+                raise
+
+
+def backfill_counters(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Recomputes team_count and pick_count for every draft, one batch of draft_ids per transaction so that
+    live drafts are never locked for long. Returns the number of drafts that were corrected.
+    """
+
+    with db.engine.begin() as connection:
+        bounds = connection.execute(sqlalchemy.text("""
+            SELECT MIN(draft_id), MAX(draft_id) FROM drafts
+        """)).one()
+
+    if bounds[0] is None:
+        return 0
+
+    updated = 0
+    for first_draft_id in range(bounds[0], bounds[1] + 1, batch_size):
+        updated += backfill_batch(first_draft_id, first_draft_id + batch_size - 1)
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.maintenance", description="Draft counter maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill-counters", help="recompute team_count and pick_count for every draft")
+    backfill.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    commands.add_parser("check-counters", help="list drafts whose counters are out of date; exits 1 if there are any")
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill-counters":
+        print(f"Updated counters of {backfill_counters(args.batch_size)} drafts")
+        return 0
+
+    with db.engine.begin() as connection:
+        mismatches = counter_mismatches(connection)
+    for row in mismatches:
+        print(f"draft {row.draft_id}: team_count {row.team_count} (actual {row.actual_team_count}), "
+              f"pick_count {row.pick_count} (actual {row.actual_pick_count})")
+    print(f"{len(mismatches)} drafts with inconsistent counters")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import contextvars
+import time
+import sqlalchemy
+from sqlalchemy import pool
+from starlette.routing import Match
+
+# Request and query metrics in the Prometheus text format, served on /metrics.
+# MetricsMiddleware times every request under its route template, and the
+# engine hooks attribute each SQL statement and pool checkout to the request
+# that made it, so a route whose query count grows shows up as a regression.
+# Like transaction_counters, the metrics are kept per server process.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# statements run outside of a request (startup, background tasks) are labelled with this route
+BACKGROUND_ROUTE = "background"
+# requests that match no route share one label, so unknown paths cannot create new series
+UNMATCHED_ROUTE = "unmatched"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=""):
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A metric family with one sample per combination of label values.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.samples = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for values, sample in sorted(self.samples.items()):
+            lines.extend(self.render_sample(values, sample))
+        return lines
+
+    def render_sample(self, values, sample):
+        return [f"{self.name}{format_labels(self.labels, values)} {format_value(sample)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, values=(), amount=1):
+        self.samples[values] = self.samples.get(values, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, values=(), amount=1):
+        self.samples[values] = self.samples.get(values, 0) + amount
+
+    def dec(self, values=(), amount=1):
+        self.inc(values, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, values, value):
+        sample = self.samples.get(values)
+        if sample is None:
+            # per-bucket counts (made cumulative when rendered), sum and count
+            sample = self.samples[values] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample[0][i] += 1
+                break
+        sample[1] += value
+        sample[2] += 1
+
+    def render_sample(self, values, sample):
+        counts, total, count = sample
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            bucket_labels = format_labels(self.labels, values, 'le="' + str(bound) + '"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        bucket_labels = format_labels(self.labels, values, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {format_value(total)}")
+        lines.append(f"{self.name}_count{format_labels(self.labels, values)} {count}")
+        return lines
+
+
+requests_total = Counter("mockmaster_http_requests_total", "HTTP requests by route, method and status code.", ("route", "method", "status"))
+request_duration = Histogram("mockmaster_http_request_duration_seconds", "Time to respond to a request, by route.", ("route", "method"))
+requests_in_flight = Gauge("mockmaster_http_requests_in_flight", "Requests currently being handled, by route.", ("route", "method"))
+statements_total = Counter("mockmaster_db_statements_total", "SQL statements executed, by the route that ran them.", ("route",))
+statement_duration = Histogram("mockmaster_db_statement_duration_seconds", "Time to execute a SQL statement, by route.", ("route",), STATEMENT_BUCKETS)
+statements_per_request = Histogram("mockmaster_db_statements_per_request", "SQL statements executed by one request, by route.", ("route", "method"), STATEMENT_COUNT_BUCKETS)
+checkout_wait = Histogram("mockmaster_db_pool_checkout_seconds", "Time to get a connection from the pool, including opening a new one, by pool and route.", ("pool", "route"), STATEMENT_BUCKETS)
+checkout_timeouts = Counter("mockmaster_db_pool_checkout_timeouts_total", "Checkouts that gave up after the pool timeout, by pool and route.", ("pool", "route"))
+
+METRICS = [requests_total, request_duration, requests_in_flight, statements_total, statement_duration, statements_per_request, checkout_wait,
+           checkout_timeouts]
+
+# engines whose pool occupancy is reported
+_pools = []
+
+
+class RequestStatistics:
+    def __init__(self, route):
+        self.route = route
+        self.statements = 0
+
+
+# the request being handled by the current task; the engine hooks read it to label statements
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def current_route():
+    request = current_request.get()
+    return BACKGROUND_ROUTE if request is None else request.route
+
+
+def route_template(scope):
+    """
+    Returns the path template of the route that will handle the request, e.g. /drafts/{draft_id}/pick.
+    """
+
+    partial = None
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return route.path
+        if match is Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, status code and in-flight count of every HTTP request under its route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = (route_template(scope), scope["method"])
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        statistics = RequestStatistics(labels[0])
+        token = current_request.set(statistics)
+        requests_in_flight.inc(labels)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_duration.observe(labels, time.perf_counter() - start)
+            requests_in_flight.dec(labels)
+            requests_total.inc(labels + (status,))
+            statements_per_request.observe(labels, statistics.statements)
+            current_request.reset(token)
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    route = current_route()
+    statements_total.inc((route,))
+    statement_duration.observe((route,), time.perf_counter() - context._metrics_start)
+    request = current_request.get()
+    if request is not None:
+        request.statements += 1
+
+
+def instrument(engine):
+    """
+    Counts and times every statement the engine executes. Pass the sync_engine of an AsyncEngine.
+    """
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    sqlalchemy.event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def pool_name(connection_pool):
+    # the pool_logging_name given to create_engine
+    return getattr(connection_pool, "logging_name", None) or "default"
+
+
+def timed_checkout(connection_pool, checkout):
+    labels = (pool_name(connection_pool), current_route())
+    start = time.perf_counter()
+    try:
+        return checkout()
+    except sqlalchemy.exc.TimeoutError:
+        checkout_timeouts.inc(labels)
+        raise
+    finally:
+        checkout_wait.observe(labels, time.perf_counter() - start)
+
+
+class TimedQueuePool(pool.QueuePool):
+    """
+    QueuePool that records how long each checkout takes.
+    """
+
+    def _do_get(self):
+        return timed_checkout(self, super()._do_get)
+
+
+class TimedAsyncQueuePool(pool.AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long each checkout takes.
+    """
+
+    def _do_get(self):
+        return timed_checkout(self, super()._do_get)
+
+
+def register_pool(engine):
+    """
+    Reports the size and occupancy of the engine's pool. The pool is looked up when rendering, since dispose() replaces it.
+    """
+
+    _pools.append(engine)
+
+
+def render_pools():
+    lines = []
+    for name, description in [("size", "Connections the pool keeps open"), ("checked_out", "Connections in use"),
+                              ("idle", "Open connections waiting in the pool"), ("overflow", "Connections open beyond the pool size")]:
+        metric = f"mockmaster_db_pool_{name}"
+        lines.append(f"# HELP {metric} {description}, by pool.")
+        lines.append(f"# TYPE {metric} gauge")
+        for engine in _pools:
+            connection_pool = engine.pool
+            # overflow() counts up from -size while the pool is not yet full
+            value = {"size": connection_pool.size(), "checked_out": connection_pool.checkedout(), "idle": connection_pool.checkedin(),
+                     "overflow": max(0, connection_pool.overflow())}[name]
+            lines.append(f"{metric}{format_labels(('pool',), (pool_name(connection_pool),))} {value}")
+    return lines
+
+
+def render(transaction_counters=None):
+    """
+    Returns every metric in the Prometheus text exposition format, followed by the transaction counters if given.
+    """
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(render_pools())
+
+    if transaction_counters is not None:
+        for counter, description in [("attempts", "Transaction attempts"), ("aborts", "Transactions rolled back by a serialization failure or deadlock"),
+                                     ("exhausted", "Transactions that failed every retry")]:
+            name = f"mockmaster_transaction_{counter}_total"
+            lines.append(f"# HELP {name} {description}, by transaction.")
+            lines.append(f"# TYPE {name} counter")
+            for transaction, counters in sorted(transaction_counters.items()):
+                lines.append(f"{name}{format_labels(('transaction',), (transaction,))} {counters[counter]}")
+
+    return "\n".join(lines) + "\n"
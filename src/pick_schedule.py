@@ -0,0 +1,34 @@
+# The order in which draft positions pick, written to pick_schedule when a
+# draft starts. Everything that needs to know whose turn it is reads the
+# schedule, so a new order format only needs a new entry here.
+
+ORDERS = ["snake", "linear", "third_round_reversal"]
+
+
+def reverses(order, round_number):
+    """
+    Returns whether the round with the given zero-based number runs from the last draft position to the first.
+    """
+
+    if order == "snake":
+        return round_number % 2 == 1
+    if order == "linear":
+        return False
+    if order == "third_round_reversal":
+        # like snake, except that the third round repeats the order of the second
+        return round_number % 2 == 1 if round_number < 2 else round_number % 2 == 0
+    raise ValueError(f"Unknown draft order {order}")
+
+
+def draft_positions(number_of_teams, rounds, order="snake"):
+    """
+    Returns the draft position that makes each pick of the draft, in pick order.
+    """
+
+    positions = []
+    for round_number in range(rounds):
+        round_positions = range(1, number_of_teams + 1)
+        if reverses(order, round_number):
+            round_positions = reversed(round_positions)
+        positions.extend(round_positions)
+    return positions
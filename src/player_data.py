@@ -0,0 +1,47 @@
+import asyncio
+from src import database as db
+from src import draft_state
+from src import player_index
+from src import stats_cache
+
+# Everything a worker keeps in memory about players: the search index, the
+# cached statistics responses and the player positions used to check picks.
+# data/ingest.py --load notifies the player_data channel once a new season is
+# committed, and every worker rebuilds its copies from the refreshed views.
+
+CHANNEL = "player_data"
+
+_reload = None
+
+
+async def reload():
+    """
+    Rebuilds the player index and drops every cache built from the old player data. With a replica, waits for it
+    to catch up first, since the reloaded data is read from it.
+    """
+
+    await db.wait_for_replica()
+    await player_index.load()
+    stats_cache.invalidate()
+    draft_state.forget_player_positions()
+
+
+def reload_soon():
+    """
+    Starts a reload in the background. A reload already in progress is followed by another, so data committed
+    while it was reading is never missed.
+    """
+
+    global _reload
+    previous = _reload
+
+    async def run():
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await reload()
+
+    _reload = asyncio.create_task(run())
+
+
+def dispatch(connection, pid, channel, payload):
+    reload_soon()
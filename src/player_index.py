@@ -0,0 +1,156 @@
+import asyncio
+import numpy as np
+import sqlalchemy
+from src import database as db
+
+# player_points is small and only changes when a season is ingested, so search
+# runs against an in-process columnar copy of it instead of querying Postgres on
+# every request. player_data.reload rebuilds the copy after each ingest.
+
+SORT_COLUMNS = [
+    "player_name",
+    "year",
+    "age",
+    "position",
+    "team",
+    "fantasy_points_standard_10",
+    "fantasy_points_ppr_10"
+]
+
+
+class PlayerIndex:
+    """
+    NumPy arrays for every column of player_points, plus a precomputed ascending order for each sort column.
+    Filtering and paging are vectorized over these arrays.
+    """
+
+    def __init__(self, rows):
+        self.size = len(rows)
+        self.player_id = np.array([row.player_id for row in rows], dtype=str)
+        self.player_name = np.array([row.player_name for row in rows], dtype=str)
+        self.year = np.array([row.year for row in rows], dtype=np.int64)
+        self.age = np.array([row.age for row in rows], dtype=np.int64)
+        self.position = np.array([row.position for row in rows], dtype=str)
+        self.team = np.array([row.team for row in rows], dtype=str)
+        self.fantasy_points_standard_10 = np.array([row.fantasy_points_standard_10 for row in rows], dtype=np.int64)
+        self.fantasy_points_ppr_10 = np.array([row.fantasy_points_ppr_10 for row in rows], dtype=np.int64)
+
+        # lowercase copies for case-insensitive matching
+        self.player_name_lower = np.char.lower(self.player_name)
+        self.position_lower = np.char.lower(self.position)
+        self.team_lower = np.char.lower(self.team)
+
+        # the seasons there is data for, newest first
+        self.years = sorted({int(year) for year in self.year}, reverse=True)
+
+        self.rows_by_key = {(player_id, int(year)): i for i, (player_id, year) in enumerate(zip(self.player_id, self.year))}
+
+        # player_id and year break ties so that every sort order is total
+        self.orders = {}
+        self.ranks = {}
+        for column in SORT_COLUMNS:
+            order = np.lexsort((self.year, self.player_id, getattr(self, column)))
+            rank = np.empty(self.size, dtype=np.int64)
+            rank[order] = np.arange(self.size)
+            self.orders[column] = order
+            self.ranks[column] = rank
+
+    def rank(self, sort_col, descending, player_id, year):
+        """
+        Returns the position of the row with the given key in the requested sort order, or None if it does not exist.
+        """
+
+        i = self.rows_by_key.get((player_id, year))
+        if i is None:
+            return None
+        rank = self.ranks[sort_col][i]
+        return self.size - 1 - rank if descending else rank
+
+    def search(self, player_name="", year=None, age=None, position=None, team="",
+               sort_col="fantasy_points_ppr_10", descending=True, after=None, before=None, limit=10):
+        """
+        Returns (row indexes, more) for one page of matches. `after`/`before` are ranks from PlayerIndex.rank;
+        `more` tells whether further matches exist past the page in the direction being read.
+        """
+
+        mask = np.ones(self.size, dtype=bool)
+        if player_name != "":
+            mask &= np.char.find(self.player_name_lower, player_name.lower()) >= 0
+        if year is not None:
+            mask &= self.year == year
+        if age is not None:
+            mask &= self.age == age
+        if position is not None:
+            mask &= self.position_lower == position.lower()
+        if team != "":
+            mask &= np.char.find(self.team_lower, team.lower()) >= 0
+
+        order = self.orders[sort_col]
+        if descending:
+            order = order[::-1]
+        ordered_mask = mask[order]
+        matches = order[ordered_mask]
+        # ranks of the matches in the requested order, which are increasing
+        match_ranks = np.flatnonzero(ordered_mask)
+
+        if before is not None:
+            end = np.searchsorted(match_ranks, before, side="left")
+            start = max(0, end - limit)
+            return matches[start:end], start > 0
+
+        start = 0 if after is None else np.searchsorted(match_ranks, after, side="right")
+        return matches[start:start + limit], start + limit < len(matches)
+
+    def row(self, i):
+        return {
+            "player_id": str(self.player_id[i]),
+            "player_name": str(self.player_name[i]),
+            "year": int(self.year[i]),
+            "age": int(self.age[i]),
+            "position": str(self.position[i]),
+            "team": str(self.team[i]),
+            "fantasy_points_standard_10": int(self.fantasy_points_standard_10[i]),
+            "fantasy_points_ppr_10": int(self.fantasy_points_ppr_10[i])
+        }
+
+    def records(self, indexes):
+        """
+        Returns the search results for the given rows, with the fantasy points divided, converting each column at once.
+        """
+
+        columns = ["player_id", "player_name", "year", "age", "position", "team", "standard_fantasy_points", "ppr_fantasy_points"]
+        values = zip(
+            self.player_id[indexes].tolist(),
+            self.player_name[indexes].tolist(),
+            self.year[indexes].tolist(),
+            self.age[indexes].tolist(),
+            self.position[indexes].tolist(),
+            self.team[indexes].tolist(),
+            (self.fantasy_points_standard_10[indexes] / 10).tolist(),
+            (self.fantasy_points_ppr_10[indexes] / 10).tolist()
+        )
+        return [dict(zip(columns, row)) for row in values]
+
+
+index = None
+_load_lock = asyncio.Lock()
+
+
+async def load():
+    """
+    Builds the index from the player_points materialized view.
+    """
+
+    global index
+    async with db.read_transaction() as connection:
+        rows = (await connection.execute(sqlalchemy.select(db.player_points))).fetchall()
+    index = PlayerIndex(rows)
+    return index
+
+
+async def get():
+    if index is None:
+        async with _load_lock:
+            if index is None:
+                await load()
+    return index
@@ -0,0 +1,9 @@
+# The minimum and maximum number of players of each position on a roster, by
+# roster size. create_draft_room writes them to position_requirements for every
+# new draft; the fake data generator and the load test build rosters against them.
+
+POSITIONAL_REQUIREMENTS = {
+    8: {'QB': (1, 3), 'RB': (1, 3), 'WR': (1, 3), 'TE': (1, 3)},
+    10: {'QB': (1, 4), 'RB': (1, 4), 'WR': (1, 4), 'TE': (1, 4)},
+    12: {'QB': (2, 4), 'RB': (2, 4), 'WR': (2, 4), 'TE': (2, 4)}
+}
@@ -0,0 +1,45 @@
+import hashlib
+from src import lru_cache
+
+# Serialized /players/{player_id}/ responses. Season statistics only change
+# when a new season is ingested, which must call invalidate().
+
+class CachedResponse:
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class ResponseCache(lru_cache.LRUCache):
+    """
+    Bounded LRU cache of serialized response bodies, each with a strong ETag derived from its content.
+    """
+
+    def put(self, key, body):
+        entry = CachedResponse(body)
+        super().put(key, entry)
+        return entry
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.clear()
+        else:
+            self.pop(key)
+
+
+player_statistics = ResponseCache(maxsize=4096)
+
+
+def invalidate(player_id=None):
+    """
+    Drops the cached statistics of one player, or of every player when no player_id is given.
+    """
+
+    player_statistics.invalidate(player_id)
+
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))